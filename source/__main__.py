@@ -9,6 +9,8 @@ if __name__ == '__main__':
     parser.add_argument('-s', '--stanford_path', help='Absolute path to the StanfordCoreNLP module', required=True)
     parser.add_argument('-k', '--api_key', help='Key ID to GATE Cloud', required=True)
     parser.add_argument('-p', '--api_password', help='Password to GATE Cloud', required=True)
+    parser.add_argument('-a', '--alias_dump', help='Absolute path to an alias dump (alias, entity id, count per line) for offline entity linking', default=None)
+    parser.add_argument('-c', '--min_confidence', help='Skip the OpenIE triples below this confidence', type=float, default=None)
     args = parser.parse_args()
     
     # Check if the user wants to prepare input files
@@ -31,18 +33,30 @@ if __name__ == '__main__':
     print('1) LDA')
     print('2) Graph Construction')
     print('3) Disambiguation')
+    print('4) LDA Update')
+    print('5) Claim Matching Server')
+    print('6) Graph Update')
     choice = input('Enter corresponding number: ')
 
     # Validate user input and pass the choice to KGConstruction class
     if choice == '1':
         print('You have chosen LDA\n')
-        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.LDA, prepare_files=prepare_files)
+        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.LDA, prepare_files=prepare_files, alias_dump=args.alias_dump, min_confidence=args.min_confidence)
     elif choice == '2':
         print('You have chosen Graph Construction\n')
-        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.CONSTRUCTION, prepare_files=prepare_files)
+        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.CONSTRUCTION, prepare_files=prepare_files, alias_dump=args.alias_dump, min_confidence=args.min_confidence)
     elif choice == '3':
         print('You have chosen Disambiguation\n')
-        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.DISAMBIGUATION, prepare_files=prepare_files)
+        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.DISAMBIGUATION, prepare_files=prepare_files, alias_dump=args.alias_dump, min_confidence=args.min_confidence)
+    elif choice == '4':
+        print('You have chosen LDA Update\n')
+        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.LDA_UPDATE, prepare_files=prepare_files, alias_dump=args.alias_dump, min_confidence=args.min_confidence)
+    elif choice == '5':
+        print('You have chosen Claim Matching Server\n')
+        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.SERVE, prepare_files=prepare_files, alias_dump=args.alias_dump, min_confidence=args.min_confidence)
+    elif choice == '6':
+        print('You have chosen Graph Update\n')
+        misinfo_classification = KGConstruction(args.working_dir, args.stanford_path, args.api_key, args.api_password, mode=Mode.GRAPH_UPDATE, prepare_files=prepare_files, alias_dump=args.alias_dump, min_confidence=args.min_confidence)
     else:
         print('Invalid choice')
         exit()
@@ -0,0 +1,102 @@
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from tqdm import tqdm
+import threading
+import requests
+import time
+
+GATE_CLOUD_URL = 'https://cloud-api.gate.ac.uk/process'
+
+# Responses worth retrying: rate limited or a temporary server error
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class TokenBucket:
+    # Thread-safe token bucket shared by all requests: refills `rate` tokens per second, up to `capacity`
+
+    def __init__(self, rate=1.0, capacity=1) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last_refill = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Block until a token is available and take it
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return None
+                wait = (1 - self.tokens) / self.rate
+
+            time.sleep(wait)
+
+class ApiClient:
+    # HTTP client shared by the GATE Cloud services (ANNIE NER and YODIE): pooled connections, a shared token
+    # bucket for the API quota, retries with exponential backoff on 429/5xx and concurrent in-flight requests
+
+    def __init__(self, key_id, password, rate=1.0, burst=1, max_workers=4, retries=5, backoff_factor=1.0,
+                 timeout=60, base_url=GATE_CLOUD_URL, cache=None) -> None:
+        self.base_url = base_url
+        # Optional ResponseCache, responses found there don't use the API quota at all
+        self.cache = cache
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+
+        self.session = requests.Session()
+        self.session.auth = (key_id, password)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    # Send a text to a service and return the response body; every attempt (including retries) takes a token.
+    # With exact_cache_key the response is only reused for the very same text, not for texts that normalise alike.
+    def post(self, service, text, exact_cache_key=False):
+        if self.cache is not None:
+            cached = self.cache.get(service, text, exact_cache_key)
+            if cached is not None:
+                return cached
+
+        headers = {
+            "Content-Type": "text/plain"
+        }
+
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            try:
+                response = self.session.post(f'{self.base_url}/{service}', data=text.encode('utf-8'),
+                                             headers=headers, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.retries:
+                    raise
+                time.sleep(self.backoff(attempt))
+                continue
+
+            if response.status_code in RETRY_STATUSES and attempt < self.retries:
+                time.sleep(self.backoff(attempt, response.headers.get('Retry-After')))
+                continue
+
+            response.raise_for_status()
+            if self.cache is not None:
+                self.cache.put(service, text, response.text, exact_cache_key)
+
+            return response.text
+
+    def backoff(self, attempt, retry_after=None):
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+
+        return self.backoff_factor * (2 ** attempt)
+
+    # Send many texts to a service concurrently (up to max_workers in flight), responses are returned in order
+    def map(self, service, texts, exact_cache_key=False):
+        texts = list(texts)
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(tqdm(executor.map(lambda text: self.post(service, text, exact_cache_key), texts), total=len(texts)))
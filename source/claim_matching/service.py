@@ -0,0 +1,180 @@
+from source.claim_matching.vector_index import VectorIndex, normalise
+from source.disambiguation.embedding_store import EmbeddingStore
+from source.disambiguation.wiki_disambiguation import load_model
+from source.entity_matcher import EntityMatcher
+from source.graph_query import GraphQuery
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import socketserver
+import numpy as np
+import threading
+import queue
+import json
+import time
+
+class ClaimMatcher:
+    # Matches incoming claims against the fact-checked claims behind the knowledge graph. Every known triple is
+    # embedded once (and kept in the embedding store between runs); a claim is embedded, compared with all the
+    # triples through the vector index, and the claims the closest triples came from are returned, together with
+    # the graph entities mentioned in the claim and their known relations.
+
+    def __init__(self, graph, triples, documents, model_name='distilbert-base-nli-mean-tokens', embedding_dir=None,
+                 num_partitions=None, nprobe=4, batch_size=64, max_facts=10) -> None:
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_facts = max_facts
+        self.documents = documents
+        self.query = GraphQuery(graph)
+        self.matcher = EntityMatcher(graph.node_names)
+
+        # One index entry per distinct triple text, with the first document it was extracted from
+        texts = triples['Subject'].astype(str) + ' ' + triples['Verb'].astype(str) + ' ' + triples['Object'].astype(str)
+        unique = ~texts.duplicated()
+        self.triple_texts = texts[unique].tolist()
+        self.triple_documents = triples['Document'][unique].to_numpy()
+
+        store = EmbeddingStore(embedding_dir, model_name) if embedding_dir is not None else None
+        vectors = store.encode(self.triple_texts, self.encode) if store is not None else self.encode(self.triple_texts)
+        self.index = VectorIndex(vectors, num_partitions=num_partitions, nprobe=nprobe)
+        print(f'Claim matcher ready: {len(self.index)} triples, {graph.num_nodes} entities')
+
+    def encode(self, texts):
+        model = load_model(self.model_name)
+        return normalise(model.encode(list(texts), batch_size=self.batch_size))
+
+    # Match a batch of claims at once: one encoder call, one index search and one graph lookup for all of them
+    def match_batch(self, claims, k=5):
+        if not claims:
+            return []
+
+        # Several triples can come from the same claim, so more candidates than k are retrieved
+        ids, scores = self.index.search(self.encode(claims), k=4 * k)
+        mentions = [sorted(set(entity for _, _, entity in self.matcher.find(claim))) for claim in claims]
+        entities = sorted(set(entity for claim_mentions in mentions for entity in claim_mentions))
+        facts = dict(zip(entities, self.query.neighbours_batch([(entity, None) for entity in entities])))
+
+        results = []
+        for claim, claim_mentions, claim_ids, claim_scores in zip(claims, mentions, ids, scores):
+            matches = dict()
+            for triple_id, score in zip(claim_ids.tolist(), claim_scores.tolist()):
+                if triple_id < 0:
+                    break
+                document = self.triple_documents[triple_id].item()
+                if document not in matches:
+                    matches[document] = {'document': document, 'claim': self.documents.get(document),
+                                         'triple': self.triple_texts[triple_id], 'score': score}
+                if len(matches) == k:
+                    break
+
+            results.append({'claim': claim, 'matches': list(matches.values()), 'entities': claim_mentions,
+                            'facts': {entity: facts[entity][:self.max_facts] for entity in claim_mentions}})
+
+        return results
+
+    def match(self, claim, k=5):
+        return self.match_batch([claim], k)[0]
+
+class MicroBatcher:
+    # Groups concurrent requests into batches: a worker thread waits for the first request and then collects more
+    # for up to max_latency seconds (or until max_batch_size), so the encoder and the index see batches instead of
+    # single claims while a lone request is delayed by at most max_latency.
+
+    def __init__(self, function, max_batch_size=32, max_latency=0.005) -> None:
+        self.function = function
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.requests = queue.Queue()
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    # Returns a Future for the result of function on this item
+    def submit(self, item):
+        future = Future()
+        self.requests.put((item, future))
+        return future
+
+    def run(self):
+        while True:
+            batch = [self.requests.get()]
+            if batch[0] is None:
+                return None
+
+            deadline = time.perf_counter() + self.max_latency
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                try:
+                    request = self.requests.get(timeout=timeout) if timeout > 0 else self.requests.get_nowait()
+                except queue.Empty:
+                    break
+                if request is None:
+                    self.requests.put(None)
+                    break
+                batch.append(request)
+
+            try:
+                results = self.function([item for item, _ in batch])
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def close(self):
+        self.requests.put(None)
+        self.worker.join()
+
+class ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class ClaimRequestHandler(BaseHTTPRequestHandler):
+    # POST /match with {"claim": "..."} answers with the match result as JSON
+
+    def do_POST(self):
+        if self.path != '/match':
+            self.send_error(404)
+            return None
+
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            claim = request['claim']
+        except (ValueError, KeyError, TypeError):
+            self.send_error(400, 'Expected a JSON body with a claim')
+            return None
+
+        body = json.dumps(self.server.batcher.submit(claim).result()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        return None
+
+def serve(batcher, host='localhost', port=8080):
+    server = ThreadingHTTPServer((host, port), ClaimRequestHandler)
+    server.batcher = batcher
+    print(f'Serving claim matching on http://{host}:{port}/match')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    return None
+
+# Latency of single claims submitted concurrently through the batcher, in milliseconds
+def benchmark(batcher, claims, concurrency=16):
+    def timed(claim):
+        start = time.perf_counter()
+        batcher.submit(claim).result()
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        latencies = np.array(list(executor.map(timed, claims))) * 1000
+    elapsed = time.perf_counter() - start
+
+    return {'requests': len(claims), 'p50': float(np.percentile(latencies, 50)),
+            'p99': float(np.percentile(latencies, 99)), 'throughput': len(claims) / elapsed}
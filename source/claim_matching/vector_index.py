@@ -0,0 +1,99 @@
+from source.graph_query import build_index
+import numpy as np
+
+class VectorIndex:
+    # Exact cosine search over a normalised float32 matrix with batched NumPy matrix products. With num_partitions
+    # the vectors are first grouped around spherical k-means centroids, and a query is only compared with the
+    # vectors of its nprobe closest partitions, which trades a little recall for speed on large indexes.
+
+    def __init__(self, vectors, num_partitions=None, nprobe=4, iterations=10, chunk_size=262144, seed=0) -> None:
+        self.vectors = normalise(vectors)
+        self.nprobe = nprobe
+        self.chunk_size = chunk_size
+        self.centroids = None
+
+        if num_partitions and len(self.vectors) > num_partitions:
+            self.centroids, assignments = self.kmeans(num_partitions, iterations, np.random.default_rng(seed))
+            # Vectors sorted by partition so that every partition is a contiguous block
+            self.partition_offsets, self.rows = build_index(assignments, num_partitions)
+            self.vectors = self.vectors[self.rows]
+        else:
+            self.rows = np.arange(len(self.vectors))
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def kmeans(self, num_partitions, iterations, rng):
+        centroids = self.vectors[rng.choice(len(self.vectors), num_partitions, replace=False)]
+
+        for _ in range(iterations):
+            assignments = self.assign(centroids)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, self.vectors)
+            # Empty partitions keep their old centroid
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalise(sums)
+
+        return centroids, self.assign(centroids)
+
+    def assign(self, centroids):
+        return np.concatenate([np.argmax(self.vectors[start:start + self.chunk_size] @ centroids.T, axis=1)
+                               for start in range(0, len(self.vectors), self.chunk_size)])
+
+    # The k most similar vectors for every query, as (ids, scores) arrays of shape (num queries, k), best first.
+    # Ids are rows of the matrix the index was built from, missing results are padded with id -1.
+    def search(self, queries, k=5):
+        queries = normalise(queries)
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        if len(self.vectors) == 0 or len(queries) == 0:
+            return ids, scores
+
+        if self.centroids is None:
+            # Brute force over the whole matrix, chunked so the score matrix stays small
+            candidates = [top_k(queries @ self.vectors[start:start + self.chunk_size].T, k, start)
+                          for start in range(0, len(self.vectors), self.chunk_size)]
+            found_ids, found_scores = top_k(np.concatenate([s for _, s in candidates], axis=1), k)
+            all_ids = np.concatenate([i for i, _ in candidates], axis=1)
+            found_ids = np.take_along_axis(all_ids, found_ids, axis=1)
+        else:
+            found_ids, found_scores = self.search_partitions(queries, k)
+
+        ids[:, :found_ids.shape[1]] = np.where(found_ids >= 0, self.rows[np.maximum(found_ids, 0)], -1)
+        scores[:, :found_scores.shape[1]] = found_scores
+
+        return ids, scores
+
+    def search_partitions(self, queries, k):
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+
+        for query_idx, partitions in enumerate(probes):
+            blocks = [np.arange(self.partition_offsets[p], self.partition_offsets[p + 1]) for p in partitions]
+            rows = np.concatenate(blocks)
+            if len(rows) == 0:
+                continue
+            found, found_scores = top_k(queries[query_idx:query_idx + 1] @ self.vectors[rows].T, k)
+            ids[query_idx, :found.shape[1]] = rows[found[0]]
+            scores[query_idx, :found.shape[1]] = found_scores[0]
+
+        return ids, scores
+
+# Column indices (plus offset) and values of the k largest entries of every row, in descending order
+def top_k(scores, k, offset=0):
+    k = min(k, scores.shape[1])
+    idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    values = np.take_along_axis(scores, idx, axis=1)
+    order = np.argsort(-values, axis=1)
+
+    return np.take_along_axis(idx, order, axis=1) + offset, np.take_along_axis(values, order, axis=1)
+
+def normalise(vectors):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if vectors.ndim == 2 and len(vectors):
+        vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+    return vectors
@@ -0,0 +1,145 @@
+from collections import defaultdict
+from source.utils import normalise
+import numpy as np
+import math
+import time
+import csv
+
+class AliasIndex:
+    # Offline entity linking index built from an alias dump (alias -> DBpedia/Wikipedia id with prior counts).
+    # Exact lookups go through a hash table, fuzzy lookups through a character n-gram inverted index. The posting
+    # lists are sorted arrays of alias ids: candidates of a possible size are only gathered from the rarest n-grams of
+    # a query (prefix filtering) and then looked up by binary search in the other lists, dropping those that can't
+    # reach the threshold anymore, so the long lists of common n-grams are never walked.
+
+    def __init__(self, n=3) -> None:
+        self.n = n
+        # Normalised alias -> list of (entity id, prior count), most frequent first
+        self.candidates = defaultdict(list)
+        # Alias id -> alias, alias id -> number of distinct n-grams, n-gram -> alias ids
+        self.aliases = []
+        self.ngram_counts = []
+        self.ngram_index = defaultdict(list)
+
+    # Dump format: one alias per line, tab separated: alias, entity id, count
+    @classmethod
+    def from_dump(cls, path, n=3, min_count=1):
+        index = cls(n)
+
+        with open(path, 'r', encoding='utf-8') as file:
+            for row in csv.reader(file, delimiter='\t', quoting=csv.QUOTE_NONE):
+                if len(row) < 3 or not row[2].isdigit() or int(row[2]) < min_count:
+                    continue
+                index.add(row[0], row[1], int(row[2]))
+        index.build()
+
+        return index
+
+    def add(self, alias, entity_id, count):
+        self.candidates[normalise_alias(alias)].append((entity_id, count))
+
+        return None
+
+    # Sort the candidates by prior and build the n-gram inverted index over all aliases
+    def build(self):
+        for candidates in self.candidates.values():
+            candidates.sort(key=lambda candidate: candidate[1], reverse=True)
+
+        # Alias ids are given in order of the number of n-grams, so the aliases of a range of sizes are a range of
+        # ids in every posting list, and as ids are appended in increasing order every posting list is sorted
+        for alias in sorted(self.candidates, key=lambda alias: len(self.ngrams(alias))):
+            alias_id = len(self.aliases)
+            ngrams = self.ngrams(alias)
+            self.aliases.append(alias)
+            self.ngram_counts.append(len(ngrams))
+            for ngram in ngrams:
+                self.ngram_index[ngram].append(alias_id)
+
+        self.ngram_counts = np.array(self.ngram_counts, dtype=np.int32)
+        self.ngram_index = {ngram: np.array(alias_ids, dtype=np.int32) for ngram, alias_ids in self.ngram_index.items()}
+        # First alias id with at least the given number of n-grams
+        self.count_starts = np.searchsorted(self.ngram_counts, np.arange(self.ngram_counts.max(initial=0) + 2))
+
+        return None
+
+    def ngrams(self, text):
+        padded = f' {text} '
+        return set(padded[idx:idx + self.n] for idx in range(max(len(padded) - self.n + 1, 1)))
+
+    # Most likely (entity id, prior probability) for an exact alias match, or None
+    def lookup(self, alias):
+        candidates = self.candidates.get(normalise_alias(alias))
+
+        if not candidates:
+            return None
+
+        return candidates[0][0], candidates[0][1] / sum(count for _, count in candidates)
+
+    # Aliases similar to the query as (alias, entity id, Dice coefficient over character n-grams), best first
+    def fuzzy_lookup(self, alias, threshold=0.7, limit=5):
+        # Rarest n-grams first, n-grams missing from the index can't be shared with any alias
+        postings = sorted((self.ngram_index.get(ngram, ()) for ngram in self.ngrams(normalise_alias(alias))), key=len)
+        num_ngrams = len(postings)
+
+        # A Dice coefficient of at least threshold needs an alias with between min_count and max_count n-grams
+        # sharing at least min_shared of them with the query, and so at least one of its first num_ngrams -
+        # min_shared + 1 n-grams (prefix filtering)
+        min_count = math.ceil(threshold * num_ngrams / (2.0 - threshold) - 1e-9)
+        max_count = math.floor((2.0 - threshold) * num_ngrams / threshold + 1e-9)
+        min_shared = max(math.ceil(threshold * (num_ngrams + min_count) / 2.0 - 1e-9), 1)
+        if min_shared > num_ngrams:
+            return []
+
+        prefix = num_ngrams - min_shared + 1
+        first_id, last_id = self.first_alias_id(min_count), self.first_alias_id(max_count + 1)
+        alias_ids, shared = np.unique(np.concatenate([np.empty(0, dtype=np.int32)] + [
+            posting[np.searchsorted(posting, first_id):np.searchsorted(posting, last_id)]
+            for posting in postings[:prefix] if len(posting) > 0]), return_counts=True)
+        required = np.ceil(threshold * (num_ngrams + self.ngram_counts[alias_ids]) / 2.0 - 1e-9)
+
+        # Look the candidates up in the remaining n-grams, dropping those that can't reach the threshold anymore
+        for idx in range(prefix, num_ngrams + 1):
+            possible = shared + (num_ngrams - idx) >= required
+            alias_ids, shared, required = alias_ids[possible], shared[possible], required[possible]
+            if idx == num_ngrams or len(alias_ids) == 0:
+                break
+
+            posting = postings[idx]
+            if len(posting) > 0:
+                positions = np.minimum(np.searchsorted(posting, alias_ids), len(posting) - 1)
+                shared += posting[positions] == alias_ids
+
+        scores = 2.0 * shared / (num_ngrams + self.ngram_counts[alias_ids])
+        order = np.lexsort((alias_ids, -scores))[:limit]
+
+        return [(self.aliases[alias_id], self.candidates[self.aliases[alias_id]][0][0], score)
+                for alias_id, score in zip(alias_ids[order].tolist(), scores[order].tolist())]
+
+    def first_alias_id(self, count):
+        return self.count_starts[min(max(count, 0), len(self.count_starts) - 1)]
+
+    # Entity id for an entity string: exact match first, then the best fuzzy match, otherwise None
+    def link(self, entity, threshold=0.7):
+        exact = self.lookup(entity)
+        if exact is not None:
+            return exact[0]
+
+        fuzzy = self.fuzzy_lookup(entity, threshold, limit=1)
+        if fuzzy:
+            return fuzzy[0][1]
+
+        return None
+
+    # Measure the number of lookups per second over a list of queries
+    def benchmark(self, queries, fuzzy=True):
+        lookup = self.link if fuzzy else self.lookup
+
+        start = time.perf_counter()
+        for query in queries:
+            lookup(query)
+        elapsed = time.perf_counter() - start
+
+        return len(queries) / max(elapsed, 1e-9)
+
+def normalise_alias(alias):
+    return normalise(alias).lower()
@@ -0,0 +1,109 @@
+import numpy as np
+import hashlib
+import json
+import os
+
+class EmbeddingStore:
+    # Persistent store of sentence embeddings for one model. Vectors live in a raw float32 matrix file that is
+    # memory-mapped (zero-copy) and only ever appended to; a keys file holds the text hash of every row, in order.
+
+    def __init__(self, directory, model_name) -> None:
+        os.makedirs(directory, exist_ok=True)
+        prefix = f"{directory}/{model_name.replace('/', '_')}"
+        self.model_name = model_name
+        self.vectors_path = f'{prefix}.f32'
+        self.keys_path = f'{prefix}.keys'
+        self.meta_path = f'{prefix}.json'
+
+        self.dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r') as file:
+                self.dim = json.load(file)['dim']
+
+        # Text hash -> row of the matrix
+        self.index = dict()
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'r') as file:
+                for row, key in enumerate(file.read().split()):
+                    self.index[key] = row
+
+        self.vectors = None
+        self.repair()
+        self.map_vectors()
+
+    def key(self, text):
+        return hashlib.sha1(f'{self.model_name}\n{text}'.encode('utf-8')).hexdigest()
+
+    # Cut the files back to the rows that have both a vector and a key, so an interrupted append can't leave
+    # orphan vectors that the next append would be written after
+    def repair(self):
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return None
+
+        rows = min(os.path.getsize(self.vectors_path) // (4 * self.dim), len(self.index))
+        if os.path.getsize(self.vectors_path) != rows * 4 * self.dim:
+            with open(self.vectors_path, 'r+b') as file:
+                file.truncate(rows * 4 * self.dim)
+
+        if rows < len(self.index):
+            self.index = {key: row for key, row in self.index.items() if row < rows}
+            with open(self.keys_path, 'w') as file:
+                file.write(''.join(f'{key}\n' for key in sorted(self.index, key=self.index.get)))
+
+        return None
+
+    # (Re)open the memory map over all rows
+    def map_vectors(self):
+        if self.dim is None or not os.path.exists(self.vectors_path):
+            return None
+
+        rows = len(self.index)
+        if rows:
+            self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+        return None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, text):
+        return self.key(text) in self.index
+
+    # Append new vectors; the vectors are written before their keys so a crash never leaves a key without a vector
+    def append(self, texts, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.meta_path, 'w') as file:
+                json.dump({'model': self.model_name, 'dim': self.dim}, file)
+
+        # Written right after the last row with a key, over anything a failed append left behind
+        with open(self.vectors_path, 'r+b' if os.path.exists(self.vectors_path) else 'wb') as file:
+            file.seek(len(self.index) * 4 * self.dim)
+            file.write(vectors.tobytes())
+
+        keys = [self.key(text) for text in texts]
+        with open(self.keys_path, 'a') as file:
+            file.write(''.join(f'{key}\n' for key in keys))
+        for key in keys:
+            self.index[key] = len(self.index)
+
+        self.map_vectors()
+
+        return None
+
+    # Embeddings of all texts in order; only texts that were never seen before are passed to encoder
+    def encode(self, texts, encoder):
+        texts = list(texts)
+        unseen = list(dict.fromkeys(text for text in texts if self.key(text) not in self.index))
+
+        if unseen:
+            self.append(unseen, encoder(unseen))
+
+        if not texts:
+            return np.empty((0, self.dim or 0), dtype=np.float32)
+
+        rows = np.array([self.index[self.key(text)] for text in texts])
+
+        return np.asarray(self.vectors[rows])
@@ -1,55 +1,161 @@
-from sentence_transformers import SentenceTransformer, util
+from concurrent.futures import ThreadPoolExecutor
+from sentence_transformers import SentenceTransformer
+from source.disambiguation.embedding_store import EmbeddingStore
+from sqlitedict import SqliteDict
 import wikipedia
 import numpy as np
+import os
 
-# TO DO: Create a class that handles the disambiguation
-# The class takes as an input the list of entities and outputs the list of disambiguated entities
-# Connect the class to kg_construction.py
-# (Later can look for a threshold for matching- search for either levenstein distance or cosine similarity between words)
+# SentenceTransformer models loaded in this process, by name
+models = dict()
+
+def load_model(model_name):
+    if model_name not in models:
+        models[model_name] = SentenceTransformer(model_name)
+
+    return models[model_name]
+
+# TODO Look for a threshold for matching (levenstein distance or cosine similarity between words)
 class WikiDisambiguation:
-    def __init__(self, entities):
-        self.entities = entities
-        
-        # Initialise the model
+    # Links every entity to a Wikipedia page: an exact page match is taken as is, otherwise the search candidate
+    # whose first paragraph is the most similar to the claim the entity was found in.
+    # Wikipedia pages and search results are memoised in a local store and all texts are encoded in large batches.
+    def __init__(self, entities, contexts=None, model_name='distilbert-base-nli-mean-tokens', store_path=None,
+                 batch_size=64, max_workers=8, embedding_dir=None):
+        self.entities = list(entities)
+        # Claim text for every entity, the entity itself is used when there is no context
+        self.contexts = list(contexts) if contexts is not None else list(self.entities)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.store = WikiStore(store_path)
+
+        # The model is only loaded once there is a text that isn't in the embedding store
         # model = SentenceTransformer('bert-base-nli-mean-tokens')
-        self.model = SentenceTransformer('distilbert-base-nli-mean-tokens')
+        self.model_name = model_name
+        self.embeddings = EmbeddingStore(embedding_dir, model_name) if embedding_dir is not None else None
 
         self.disambiguated_entities = []
-        self.disambiguate()
+        try:
+            self.disambiguate()
+        finally:
+            self.store.close()
 
     def disambiguate(self):
-        for entity in self.entities:
-            page = wikipedia.page(entity)
-            
-            if page.exists():
-                self.disambiguated_entities.append(page.title)
-            else:
-                search_results = wikipedia.search(entity)
-                contents = []
-
-                for page_title in search_results:
-                    try:
-                        page = wikipedia.page(page_title)
-                    except wikipedia.exceptions.DisambiguationError as e:
-                        print(f'Could not find a page, picked the first option from: {e.options}')
-                        page = wikipedia.page(e.options[0])
-
-                    # Keep only the first paragraph from content
-                    contents.append(page.content.split('\n')[0])
-                
-                disinfo_embeddings = self.model.encode(sentence)
-                wiki_embeddings = self.model.encode(contents)
-
-                # Calculate cosine similarities between the the claim and the wikipedia pages
-                cosine_scores = util.pytorch_cos_sim(wiki_embeddings, disinfo_embeddings)
-
-                # Find the index of the max cosine score
-                max_similarity = np.argmax(cosine_scores)
-                self.disambiguated_entities.append(search_results[max_similarity])
+        # Entities with a page of their own don't need any scoring
+        pages = self.map(self.store.page, self.entities)
+        ambiguous = [idx for idx, page in enumerate(pages) if page is None]
+
+        # Search candidates and their first paragraphs for the remaining entities
+        search_results = self.map(self.store.search, [self.entities[idx] for idx in ambiguous])
+        titles = sorted(set(title for results in search_results for title in results))
+        paragraphs = dict(zip(titles, self.map(self.store.first_paragraph, titles)))
+
+        # Every (entity, candidate) pair that has a first paragraph to compare against
+        candidate_titles = [title for title in titles if paragraphs[title] is not None]
+        candidate_ids = {title: idx for idx, title in enumerate(candidate_titles)}
+        pair_entities = []
+        pair_candidates = []
+        for entity_idx, results in enumerate(search_results):
+            for title in results:
+                if title in candidate_ids:
+                    pair_entities.append(entity_idx)
+                    pair_candidates.append(candidate_ids[title])
+
+        disambiguated = [page['title'] if page is not None else None for page in pages]
+
+        if pair_entities:
+            # Encode all claim contexts and candidate paragraphs in batches
+            disinfo_embeddings = self.encode([self.contexts[idx] for idx in ambiguous])
+            wiki_embeddings = self.encode([paragraphs[title] for title in candidate_titles])
+
+            # Cosine similarities between the claims and the wikipedia pages of all pairs at once
+            pair_entities = np.array(pair_entities)
+            pair_candidates = np.array(pair_candidates)
+            cosine_scores = np.einsum('ij,ij->i', disinfo_embeddings[pair_entities], wiki_embeddings[pair_candidates])
+
+            # Pairs are grouped by entity, find the index of the max cosine score within every group
+            starts = np.flatnonzero(np.r_[True, pair_entities[1:] != pair_entities[:-1]])
+            ends = np.r_[starts[1:], len(pair_entities)]
+            for start, end in zip(starts, ends):
+                best = start + np.argmax(cosine_scores[start:end])
+                disambiguated[ambiguous[pair_entities[best]]] = candidate_titles[pair_candidates[best]]
+
+        self.disambiguated_entities = disambiguated
+
+    # Batched, L2-normalised embeddings, taken from the embedding store when available
+    def encode(self, texts):
+        if self.embeddings is not None:
+            embeddings = self.embeddings.encode(texts, self.encode_batch)
+        else:
+            embeddings = self.encode_batch(texts)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+        return embeddings / np.maximum(norms, 1e-12)
+
+    def encode_batch(self, texts):
+        model = load_model(self.model_name)
+        return np.asarray(model.encode(texts, batch_size=self.batch_size), dtype=np.float32)
+
+    # Fetch concurrently, results that are already in the store don't hit the network
+    def map(self, function, items):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(function, items))
 
     def get_disambiguated_entities(self):
         return self.disambiguated_entities
 
+class WikiStore:
+    # Memoises Wikipedia page lookups and search results, on disk when a path is given
+    def __init__(self, path=None):
+        if path is not None:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.db = SqliteDict(path, tablename='wikipedia', autocommit=True)
+        else:
+            self.db = dict()
+
+    def memoise(self, key, fetch):
+        if key not in self.db:
+            self.db[key] = fetch()
+
+        return self.db[key]
+
+    # The page with exactly this title as {'title', 'first_paragraph'}, None if it doesn't exist or is ambiguous
+    def page(self, title):
+        def fetch():
+            try:
+                page = wikipedia.page(title, auto_suggest=False)
+            except (wikipedia.exceptions.PageError, wikipedia.exceptions.DisambiguationError):
+                return None
+
+            return {'title': page.title, 'first_paragraph': page.content.split('\n')[0]}
+
+        return self.memoise(f'page\n{title}', fetch)
+
+    def search(self, query):
+        return self.memoise(f'search\n{query}', lambda: wikipedia.search(query))
+
+    # Keep only the first paragraph from content, disambiguation pages are resolved to their first option
+    def first_paragraph(self, title):
+        def fetch():
+            try:
+                page = wikipedia.page(title, auto_suggest=False)
+            except wikipedia.exceptions.DisambiguationError as e:
+                print(f'Could not find a page, picked the first option from: {e.options}')
+                try:
+                    page = wikipedia.page(e.options[0], auto_suggest=False)
+                except wikipedia.exceptions.WikipediaException:
+                    return None
+            except wikipedia.exceptions.PageError:
+                return None
+
+            return page.content.split('\n')[0]
+
+        return self.memoise(f'paragraph\n{title}', fetch)
+
+    def close(self):
+        if isinstance(self.db, SqliteDict):
+            self.db.close()
+
 
 # # Find the entity on Wikipedia
 # query = 'Donetsk'
@@ -0,0 +1,82 @@
+from collections import deque
+
+class EntityMatcher:
+    # Aho-Corasick automaton built once from the named entities, so that every entity occurring
+    # in a text is found in a single pass instead of one substring scan per entity
+
+    def __init__(self, entities, word_boundaries=True) -> None:
+        self.word_boundaries = word_boundaries
+
+        # State 0 is the root, transitions[state] maps a character to the next state
+        self.transitions = [dict()]
+        self.fail = [0]
+        # Entities recognised when reaching each state (including the ones reached through fail links)
+        self.outputs = [list()]
+
+        for entity in entities:
+            self.add_entity(entity)
+        self.build()
+
+    def add_entity(self, entity):
+        if not entity:
+            return None
+
+        state = 0
+        for char in entity:
+            next_state = self.transitions[state].get(char)
+            if next_state is None:
+                next_state = len(self.transitions)
+                self.transitions[state][char] = next_state
+                self.transitions.append(dict())
+                self.fail.append(0)
+                self.outputs.append(list())
+            state = next_state
+
+        self.outputs[state].append(entity)
+
+        return None
+
+    # Compute the fail links breadth-first and merge the outputs along them
+    def build(self):
+        queue = deque(self.transitions[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.transitions[state].items():
+                fail_state = self.fail[state]
+                while fail_state and char not in self.transitions[fail_state]:
+                    fail_state = self.fail[fail_state]
+                self.fail[next_state] = self.transitions[fail_state].get(char, 0)
+                self.outputs[next_state] = self.outputs[next_state] + self.outputs[self.fail[next_state]]
+                queue.append(next_state)
+
+        return None
+
+    # Return all (start, end, entity) spans of entities found in the text
+    def find(self, text):
+        spans = []
+        state = 0
+
+        for idx, char in enumerate(text):
+            while state and char not in self.transitions[state]:
+                state = self.fail[state]
+            state = self.transitions[state].get(char, 0)
+
+            for entity in self.outputs[state]:
+                start = idx + 1 - len(entity)
+                if not self.word_boundaries or self.is_whole_word(text, start, idx + 1):
+                    spans.append((start, idx + 1, entity))
+
+        return spans
+
+    # A match has to start and end on word boundaries, unless the entity itself starts/ends with a non-word character
+    def is_whole_word(self, text, start, end):
+        if start > 0 and is_word_char(text[start]) and is_word_char(text[start - 1]):
+            return False
+        if end < len(text) and is_word_char(text[end - 1]) and is_word_char(text[end]):
+            return False
+
+        return True
+
+def is_word_char(char):
+    return char.isalnum() or char == '_'
@@ -0,0 +1,269 @@
+from source.graph_export import CsrExporter
+from source.graph_snapshot import GraphSnapshot, snapshot_path
+import numpy as np
+import json
+import os
+
+class DeltaLog:
+    # Append-only log of graph updates, one JSON record per ingested batch of documents. Every record names the
+    # snapshot it applies to, so records already compacted into a newer snapshot are skipped on replay.
+
+    def __init__(self, path) -> None:
+        self.path = path
+
+    # Drop a record cut short by a crash, so that the next record starts on a line of its own. Only the writer does
+    # this, a reader may see the last record while it is still being written.
+    def repair(self):
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'rb+') as file:
+            content = file.read()
+            if content and not content.endswith(b'\n'):
+                file.truncate(content.rfind(b'\n') + 1)
+
+        return None
+
+    def append(self, snapshot_id, documents, relations):
+        self.repair()
+        record = {'snapshot': snapshot_id, 'documents': documents, 'relations': relations}
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(record) + '\n')
+            file.flush()
+            os.fsync(file.fileno())
+
+        return None
+
+    # Records made against the given snapshot, in the order they were appended
+    def records(self, snapshot_id):
+        if not os.path.exists(self.path):
+            return None
+
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                # Skip a record that is cut short or not fully written yet
+                if not line.endswith('\n'):
+                    break
+                record = json.loads(line)
+                if record['snapshot'] == snapshot_id:
+                    yield record
+
+    def clear(self):
+        open(self.path, 'w').close()
+
+class IncrementalGraph:
+    # Knowledge graph kept up to date without rebuilding it: the last CSR snapshot is the base and the triples of
+    # new documents are applied on top of it as a delta (new nodes, new edges and weight increments of existing
+    # edges), which is first appended to the delta log. compact() writes base and delta as a new snapshot once
+    # compact_threshold changes have accumulated; until then readers (see load_graph) replay the log themselves.
+
+    def __init__(self, directory, name='graph_snapshot', compact_threshold=100000) -> None:
+        self.directory = directory
+        self.name = name
+        self.compact_threshold = compact_threshold
+        self.log = DeltaLog(f'{directory}/{name}_delta.jsonl')
+        self.load()
+
+    # Open the base snapshot (if there is one) and replay the delta log on top of it
+    def load(self):
+        path = f'{self.directory}/{self.name}'
+        self.base = GraphSnapshot(path) if os.path.exists(f'{path}/meta.json') else None
+        self.snapshot_id = self.base.meta['id'] if self.base is not None else None
+        self.base_nodes = self.base.num_nodes if self.base is not None else 0
+        self.base_labels = len(self.base.label_names) if self.base is not None else 0
+        self.documents = set(self.base.meta.get('documents', [])) if self.base is not None else set()
+
+        # Delta: names and edges added after the base snapshot, ids continue after the base ones
+        self.delta_node_names = []
+        self.node_index = dict()
+        self.delta_label_names = []
+        self.label_index = dict()
+        self.sources, self.targets, self.label_ids, self.weights = [], [], [], []
+        self.edge_index = dict()
+        # Base edge position -> weight increment
+        self.increments = dict()
+
+        for record in self.log.records(self.snapshot_id):
+            self.add_relations(record['relations'])
+            self.documents.update(record['documents'])
+
+        return None
+
+    # Names of the base nodes followed by the new ones, indexed by node id
+    @property
+    def node_names(self):
+        return ConcatStrings(self.base.node_names if self.base is not None else [], self.delta_node_names)
+
+    @property
+    def label_names(self):
+        return ConcatStrings(self.base.label_names if self.base is not None else [], self.delta_label_names)
+
+    @property
+    def num_nodes(self):
+        return self.base_nodes + len(self.delta_node_names)
+
+    # Number of new edges
+    def __len__(self):
+        return len(self.sources)
+
+    # Apply the triples of new documents (given by their content keys); documents that are already in the graph are
+    # ignored by the caller
+    def apply(self, relations, documents):
+        relations = [list(relation) for relation in relations]
+        documents = [str(document) for document in documents]
+        self.log.append(self.snapshot_id, documents, relations)
+        self.add_relations(relations)
+        self.documents.update(documents)
+
+        if self.delta_size() >= self.compact_threshold:
+            self.compact()
+
+        return None
+
+    def add_relations(self, relations):
+        for subject, verb, object in relations:
+            source_id = self.node_id(subject, add=True)
+            target_id = self.node_id(object, add=True)
+            label_id = self.label_id(verb, add=True)
+
+            position = self.base_edge(source_id, target_id, label_id)
+            if position is not None:
+                self.increments[position] = self.increments.get(position, 0.0) + 1.0
+                continue
+
+            edge_key = (source_id, target_id, label_id)
+            edge_id = self.edge_index.get(edge_key)
+            if edge_id is not None:
+                self.weights[edge_id] += 1.0
+            else:
+                self.edge_index[edge_key] = len(self.sources)
+                self.sources.append(source_id)
+                self.targets.append(target_id)
+                self.label_ids.append(label_id)
+                self.weights.append(1.0)
+
+        return None
+
+    def node_id(self, name, add=False):
+        node_id = self.base.node_id(name) if self.base is not None else None
+        if node_id is None:
+            node_id = self.intern(name, self.delta_node_names, self.node_index, self.base_nodes, add)
+        return node_id
+
+    def label_id(self, verb, add=False):
+        label_id = self.base.label_id(verb) if self.base is not None else None
+        if label_id is None:
+            label_id = self.intern(verb, self.delta_label_names, self.label_index, self.base_labels, add)
+        return label_id
+
+    def node_name(self, node_id):
+        if node_id < self.base_nodes:
+            return self.base.node_names[node_id]
+        return self.delta_node_names[node_id - self.base_nodes]
+
+    def intern(self, name, names, index, first_id, add):
+        if name not in index:
+            if not add:
+                return None
+            index[name] = first_id + len(names)
+            names.append(name)
+
+        return index[name]
+
+    # Position of an edge in the base snapshot, or None
+    def base_edge(self, source_id, target_id, label_id):
+        if source_id >= self.base_nodes or target_id >= self.base_nodes or label_id >= self.base_labels:
+            return None
+
+        targets, label_ids, _ = self.base.out_edges(source_id)
+        matches = np.flatnonzero((targets == target_id) & (label_ids == label_id))
+        if len(matches) == 0:
+            return None
+
+        return int(self.base.offsets[source_id] + matches[0])
+
+    def delta_size(self):
+        return len(self.sources) + len(self.increments)
+
+    # Entities that are the object of a relation, i.e. the named entities already linked into the graph
+    def object_names(self):
+        names = set(self.node_name(target_id) for target_id in self.targets)
+        if self.base is not None:
+            names.update(self.base.node_names[int(node_id)] for node_id in np.unique(self.base.indices))
+
+        return names
+
+    # Write base and delta as a new snapshot. The delta log is cleared afterwards; if that doesn't happen its
+    # records still name the old snapshot and are skipped, so nothing is ever applied twice.
+    def compact(self):
+        exporter = CsrExporter(self.directory, self.name, meta={'documents': sorted(self.documents)})
+        exporter.write(MergedGraph(self), 1000000)
+
+        # The base has to be unmapped before its directory can be replaced (on Windows)
+        if self.base is not None:
+            self.base.close()
+            self.base = None
+        exporter.swap()
+        self.log.clear()
+        self.load()
+
+        return None
+
+class MergedGraph:
+    # Base snapshot plus delta in the interface expected by the exporters
+
+    def __init__(self, graph) -> None:
+        self.graph = graph
+        self.node_names = graph.node_names
+        self.label_names = graph.label_names
+
+    def __len__(self):
+        return (len(self.graph.base) if self.graph.base is not None else 0) + len(self.graph)
+
+    # Base edges with their increments applied, then the new edges
+    def edge_chunks(self, chunk_size=1000000):
+        graph = self.graph
+        num_base = 0
+
+        if graph.base is not None:
+            num_base = len(graph.base)
+            positions = np.fromiter(graph.increments.keys(), dtype=np.int64, count=len(graph.increments))
+            increments = np.fromiter(graph.increments.values(), dtype=np.float32, count=len(graph.increments))
+
+            for start, sources, targets, label_ids, weights in graph.base.edge_chunks(chunk_size):
+                weights = weights.copy()
+                in_chunk = (positions >= start) & (positions < start + len(weights))
+                weights[positions[in_chunk] - start] += increments[in_chunk]
+                yield start, sources, targets, label_ids, weights
+
+        for start in range(0, len(graph), chunk_size):
+            end = start + chunk_size
+            yield (num_base + start, np.array(graph.sources[start:end], dtype=np.int32),
+                np.array(graph.targets[start:end], dtype=np.int32), np.array(graph.label_ids[start:end], dtype=np.int32),
+                np.array(graph.weights[start:end], dtype=np.float32))
+
+class ConcatStrings:
+    # Read-only sequence of the base strings followed by the new ones
+
+    def __init__(self, base, extra) -> None:
+        self.base = base
+        self.extra = extra
+
+    def __len__(self):
+        return len(self.base) + len(self.extra)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self[idx] for idx in range(*item.indices(len(self)))]
+        if item < len(self.base):
+            return self.base[item]
+
+        return self.extra[item - len(self.base)]
+
+    def __iter__(self):
+        yield from self.base
+        yield from self.extra
+
+# Open the graph written by the last graph construction, with the updates made since the last compaction
+def load_graph(working_dir):
+    return IncrementalGraph(os.path.dirname(snapshot_path(working_dir)))
@@ -0,0 +1,206 @@
+from xml.sax.saxutils import quoteattr
+import pandas as pd
+import numpy as np
+import shutil
+import json
+import uuid
+import os
+
+SNAPSHOT_VERSION = 2
+
+# Export a graph to every requested format. The edges are streamed in chunks of chunk_size, so memory stays flat
+# apart from what the graph itself holds. graph: KnowledgeGraph or ColumnarKnowledgeGraph (anything providing
+# node_names, label_names, len() and edge_chunks(chunk_size))
+def export_graph(graph, directory, formats=('csv', 'csr'), chunk_size=1000000):
+    os.makedirs(directory, exist_ok=True)
+    for format in formats:
+        EXPORTERS[format](directory).export(graph, chunk_size)
+
+    return None
+
+class CsvExporter:
+    # nodes.csv and edges.csv in the layout of Gephi's spreadsheet import
+
+    def __init__(self, directory) -> None:
+        self.directory = directory
+
+    def export(self, graph, chunk_size):
+        node_names = graph.node_names
+        for start in range(0, max(len(node_names), 1), chunk_size):
+            nodes_df = pd.DataFrame({'Id': np.arange(start, min(start + chunk_size, len(node_names))),
+                                     'Label': node_names[start:start + chunk_size]})
+            nodes_df.to_csv(f'{self.directory}/nodes.csv', index=False, mode='w' if start == 0 else 'a', header=start == 0)
+
+        labels = np.array(graph.label_names, dtype=object)
+        edges_path = f'{self.directory}/edges.csv'
+        header = True
+
+        for start, sources, targets, label_ids, weights in graph.edge_chunks(chunk_size):
+            edges_df = pd.DataFrame({'Source': sources, 'Target': targets, 'Type': 'Directed',
+                'Id': np.arange(start, start + len(sources)), 'Label': labels[label_ids], 'Weight': weights})
+            edges_df.to_csv(edges_path, index=False, mode='w' if header else 'a', header=header)
+            header = False
+
+        # Keep the header even when there are no edges
+        if header:
+            pd.DataFrame(columns=['Source', 'Target', 'Type', 'Id', 'Label', 'Weight']).to_csv(edges_path, index=False)
+
+        return None
+
+class GexfExporter:
+    # graph.gexf, which Gephi opens directly with the edge labels and weights
+
+    def __init__(self, directory) -> None:
+        self.directory = directory
+
+    def export(self, graph, chunk_size):
+        labels = [quoteattr(label) for label in graph.label_names]
+
+        with open(f'{self.directory}/graph.gexf', 'w', encoding='utf-8') as file:
+            file.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                       '<gexf xmlns="http://www.gexf.net/1.2draft" version="1.2">\n'
+                       '<graph defaultedgetype="directed">\n<nodes>\n')
+            for node_id, name in enumerate(graph.node_names):
+                file.write(f'<node id="{node_id}" label={quoteattr(name)}/>\n')
+            file.write('</nodes>\n<edges>\n')
+
+            for start, sources, targets, label_ids, weights in graph.edge_chunks(chunk_size):
+                file.writelines(f'<edge id="{start + i}" source="{source}" target="{target}" label={labels[label_id]} weight="{weight}"/>\n'
+                                for i, (source, target, label_id, weight)
+                                in enumerate(zip(sources.tolist(), targets.tolist(), label_ids.tolist(), weights.tolist())))
+            file.write('</edges>\n</graph>\n</gexf>\n')
+
+        return None
+
+class CsrExporter:
+    # Binary snapshot of the graph in compressed sparse row layout, written to {directory}/graph_snapshot:
+    # offsets.npy (int64, num_nodes + 1): the edges of node i are the entries offsets[i]:offsets[i + 1] of
+    # indices.npy (int32 target ids), weights.npy (float32) and labels.npy (int32 label ids), and sources.npy holds
+    # the source id of every edge. The reverse index (edges per target) and the predicate index (edges per label)
+    # are written alongside (see write_edge_index) as reverse_* and label_*. The node names and the edge labels are
+    # stored as string tables (see write_string_table) named nodes and labels. Every array is a plain .npy file, so
+    # the snapshot can be opened with np.load(mmap_mode='r') and shared by every process through the page cache.
+    # meta.json holds the sizes, a unique id of the snapshot and any extra meta (e.g. the documents it was built from).
+
+    def __init__(self, directory, name='graph_snapshot', meta=None) -> None:
+        self.path = f'{directory}/{name}'
+        self.meta = meta or dict()
+
+    def export(self, graph, chunk_size):
+        self.write(graph, chunk_size)
+        self.swap()
+
+        return None
+
+    # Write the snapshot next to the old one, swap() then puts it in place so readers never see a partial snapshot
+    def write(self, graph, chunk_size):
+        tmp_path = f'{self.path}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        node_names = graph.node_names
+        num_nodes = len(node_names)
+        num_edges = len(graph)
+
+        # First pass: out-degree of every node
+        counts = np.zeros(num_nodes, dtype=np.int64)
+        for _, sources, _, _, _ in graph.edge_chunks(chunk_size):
+            counts += np.bincount(sources, minlength=num_nodes)
+
+        offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        np.save(f'{tmp_path}/offsets.npy', offsets)
+
+        # Second pass: place every edge in the row of its source, keeping the insertion order within a row
+        sources = np.lib.format.open_memmap(f'{tmp_path}/sources.npy', mode='w+', dtype=np.int32, shape=(num_edges,))
+        indices = np.lib.format.open_memmap(f'{tmp_path}/indices.npy', mode='w+', dtype=np.int32, shape=(num_edges,))
+        weights = np.lib.format.open_memmap(f'{tmp_path}/weights.npy', mode='w+', dtype=np.float32, shape=(num_edges,))
+        labels = np.lib.format.open_memmap(f'{tmp_path}/labels.npy', mode='w+', dtype=np.int32, shape=(num_edges,))
+        filled = offsets[:-1].copy()
+
+        for _, chunk_sources, chunk_targets, chunk_labels, chunk_weights in graph.edge_chunks(chunk_size):
+            order = np.argsort(chunk_sources, kind='stable')
+            sorted_sources = chunk_sources[order]
+            rank = np.arange(len(sorted_sources)) - np.searchsorted(sorted_sources, sorted_sources, side='left')
+            positions = filled[sorted_sources] + rank
+
+            sources[positions] = sorted_sources
+            indices[positions] = chunk_targets[order]
+            weights[positions] = chunk_weights[order]
+            labels[positions] = chunk_labels[order]
+            filled += np.bincount(chunk_sources, minlength=num_nodes)
+
+        for array in (sources, indices, weights, labels):
+            array.flush()
+
+        write_edge_index(f'{tmp_path}/reverse', indices, num_nodes, chunk_size)
+        write_edge_index(f'{tmp_path}/label', labels, len(graph.label_names), chunk_size)
+        del sources, indices, weights, labels
+
+        write_string_table(f'{tmp_path}/nodes', node_names, chunk_size)
+        write_string_table(f'{tmp_path}/labels', graph.label_names, chunk_size)
+
+        with open(f'{tmp_path}/meta.json', 'w', encoding='utf-8') as file:
+            json.dump({**self.meta, 'version': SNAPSHOT_VERSION, 'id': uuid.uuid4().hex, 'num_nodes': num_nodes,
+                       'num_edges': num_edges, 'num_labels': len(graph.label_names)}, file)
+
+        return None
+
+    # Replace the old snapshot with the written one; the old one must not be memory-mapped anymore on Windows
+    def swap(self):
+        tmp_path = f'{self.path}.tmp'
+        old_path = f'{self.path}.old'
+        shutil.rmtree(old_path, ignore_errors=True)
+        if os.path.exists(self.path):
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        shutil.rmtree(old_path, ignore_errors=True)
+
+        return None
+
+# Write an index of the edges grouped by key (e.g. their target or label): {path}_edges.npy (int64) holds the edge
+# positions ordered by key and then by position, and the positions with key i are the entries {path}_offsets.npy[i]:
+# {path}_offsets.npy[i + 1] of it. keys is read in chunks, so memory stays flat for any number of edges.
+def write_edge_index(path, keys, num_keys, chunk_size=1000000):
+    offsets = np.zeros(num_keys + 1, dtype=np.int64)
+    for start in range(0, len(keys), chunk_size):
+        offsets[1:] += np.bincount(keys[start:start + chunk_size], minlength=num_keys)
+    np.cumsum(offsets, out=offsets)
+    np.save(f'{path}_offsets.npy', offsets)
+
+    edges = np.lib.format.open_memmap(f'{path}_edges.npy', mode='w+', dtype=np.int64, shape=(len(keys),))
+    filled = offsets[:-1].copy()
+    for start in range(0, len(keys), chunk_size):
+        chunk_keys = np.asarray(keys[start:start + chunk_size])
+        order = np.argsort(chunk_keys, kind='stable')
+        sorted_keys = chunk_keys[order]
+        rank = np.arange(len(sorted_keys)) - np.searchsorted(sorted_keys, sorted_keys, side='left')
+        edges[filled[sorted_keys] + rank] = start + order
+        filled += np.bincount(chunk_keys, minlength=num_keys)
+    edges.flush()
+    del edges
+
+    return None
+
+# Write strings as a single utf-8 blob ({path}.bin) and their int64 byte offsets ({path}_offsets.npy, len(strings) + 1).
+# {path}_order.npy holds the string ids in sorted order, so a string can be looked up by binary search over the blob.
+def write_string_table(path, strings, chunk_size=1000000):
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+
+    with open(f'{path}.bin', 'wb') as file:
+        for start in range(0, len(strings), chunk_size):
+            encoded = [string.encode('utf-8') for string in strings[start:start + chunk_size]]
+            file.write(b''.join(encoded))
+            lengths = np.fromiter((len(x) for x in encoded), dtype=np.int64, count=len(encoded))
+            offsets[start + 1:start + 1 + len(encoded)] = offsets[start] + np.cumsum(lengths)
+
+    np.save(f'{path}_offsets.npy', offsets)
+    np.save(f'{path}_order.npy', np.array(sorted(range(len(strings)), key=strings.__getitem__), dtype=np.int64))
+
+    return None
+
+EXPORTERS = {
+    'csv': CsvExporter,
+    'gexf': GexfExporter,
+    'csr': CsrExporter,
+}
@@ -0,0 +1,243 @@
+import numpy as np
+
+class GraphQuery:
+    # In-process query engine over an IncrementalGraph, i.e. the last CSR snapshot plus the delta applied since. For
+    # the snapshot the forward index is its CSR itself, the reverse index (incoming edges per node) and the predicate
+    # index (edges per label) are stored in it too, so nothing is built for it and every process shares the memory
+    # maps. Only the delta, which is bounded by the compaction threshold, is indexed in memory. Edges are addressed
+    # by position: the snapshot edges first, then the new ones.
+
+    def __init__(self, graph) -> None:
+        self.graph = graph
+        self.node_names = graph.node_names
+        self.label_names = graph.label_names
+        self.num_nodes = graph.num_nodes
+        base = graph.base
+        self.num_base = len(base) if base is not None else 0
+
+        sources = np.array(graph.sources, dtype=np.int32)
+        targets = np.array(graph.targets, dtype=np.int32)
+        label_ids = np.array(graph.label_ids, dtype=np.int32)
+        weights = np.array(graph.weights, dtype=np.float32)
+        # (offsets, edge positions, first edge position) per part of the graph, edge positions are None when the
+        # edges are in the order of the index
+        self.indexes = {
+            'out': [build_index(sources, self.num_nodes, self.num_base)],
+            'in': [build_index(targets, self.num_nodes, self.num_base)],
+            'label': [build_index(label_ids, len(self.label_names), self.num_base)]
+        }
+        # (snapshot column, delta column) per edge attribute
+        self.columns = {'sources': (sources, sources), 'targets': (targets, targets),
+                        'label_ids': (label_ids, label_ids), 'weights': (weights, weights)}
+
+        if base is not None:
+            # Plain ndarray views of the memory maps, nothing is copied
+            self.indexes['out'].insert(0, (np.asarray(base.offsets), None, 0))
+            self.indexes['in'].insert(0, (np.asarray(base.reverse_offsets), np.asarray(base.reverse_edges), 0))
+            self.indexes['label'].insert(0, (np.asarray(base.label_offsets), np.asarray(base.label_edges), 0))
+            self.columns = {'sources': (np.asarray(base.sources), sources),
+                            'targets': (np.asarray(base.indices), targets),
+                            'label_ids': (np.asarray(base.label_ids), label_ids),
+                            'weights': (np.asarray(base.weights), weights)}
+
+        # Weight increments of snapshot edges, sorted by position
+        self.increment_positions = np.fromiter(sorted(graph.increments), dtype=np.int64, count=len(graph.increments))
+        self.increments = np.array([graph.increments[position] for position in self.increment_positions.tolist()],
+                                   dtype=np.float32)
+
+        # Resolved entity and verb ids, the snapshot's string lookups are a binary search over the memory map
+        self.node_ids = dict()
+        self.verb_ids = dict()
+
+    def node_id(self, name):
+        if name not in self.node_ids:
+            self.node_ids[name] = self.graph.node_id(name)
+        return self.node_ids[name]
+
+    def verb_id(self, verb):
+        if verb not in self.verb_ids:
+            self.verb_ids[verb] = self.graph.label_id(verb)
+        return self.verb_ids[verb]
+
+    # Positions of the edges from (index 'out') or to (index 'in') the given nodes, or with the given labels (index
+    # 'label'), and for each of them the position of its node or label in keys
+    def edge_positions(self, keys, index='out'):
+        positions, owners = [], []
+        for offsets, edges, first in self.indexes[index]:
+            # Nodes and labels added after the snapshot have no edges in it
+            in_part = np.flatnonzero(keys < len(offsets) - 1)
+            part_positions, part_owners = gather(offsets, keys[in_part])
+            if edges is not None:
+                part_positions = edges[part_positions]
+            positions.append(part_positions + first)
+            owners.append(in_part[part_owners])
+
+        return np.concatenate(positions), np.concatenate(owners)
+
+    # Attribute of the edges at the given positions, with the increments applied to the weights of snapshot edges
+    def column(self, name, positions):
+        base, delta = self.columns[name]
+        in_base = positions < self.num_base
+        values = np.empty(len(positions), dtype=delta.dtype)
+        values[in_base] = base[positions[in_base]]
+        values[~in_base] = delta[positions[~in_base] - self.num_base]
+
+        if name == 'weights' and len(self.increments) > 0:
+            idx = np.minimum(np.searchsorted(self.increment_positions, positions), len(self.increments) - 1)
+            matches = self.increment_positions[idx] == positions
+            values[matches] += self.increments[idx[matches]]
+
+        return values
+
+    # Edges from (or to, with direction='in') an entity as (subject, verb, object, weight) tuples, optionally only
+    # those with the given verb. Without an entity every edge with the verb is returned.
+    def neighbours(self, entity=None, verb=None, direction='out'):
+        if entity is None and verb is None:
+            raise ValueError('Either an entity or a verb is needed')
+
+        verb_id = None if verb is None else self.verb_id(verb)
+        if verb is not None and verb_id is None:
+            return []
+
+        if entity is None:
+            positions, _ = self.edge_positions(np.array([verb_id]), 'label')
+            return self.relations(positions)
+
+        node_id = self.node_id(entity)
+        if node_id is None:
+            return []
+
+        positions, _ = self.edge_positions(np.array([node_id]), direction)
+        if verb_id is not None:
+            positions = positions[self.column('label_ids', positions) == verb_id]
+
+        return self.relations(positions)
+
+    # Answer many (entity, verb) neighbour queries at once, verb can be None. The rows of all the entities are
+    # gathered in a single vectorised pass and then split per query.
+    def neighbours_batch(self, queries, direction='out'):
+        # Unknown entities (-1) and verbs (-2) match nothing, a verb id of -1 matches every verb
+        node_ids = [self.node_id(entity) for entity, _ in queries]
+        node_ids = np.array([-1 if node_id is None else node_id for node_id in node_ids], dtype=np.int64)
+        verb_ids = [-1 if verb is None else self.verb_id(verb) for _, verb in queries]
+        verb_ids = np.array([-2 if verb_id is None else verb_id for verb_id in verb_ids], dtype=np.int64)
+
+        valid = np.flatnonzero((node_ids >= 0) & (verb_ids != -2))
+        positions, owners = self.edge_positions(node_ids[valid], direction)
+
+        query_idx = valid[owners]
+        keep = (verb_ids[query_idx] < 0) | (self.column('label_ids', positions) == verb_ids[query_idx])
+        positions, query_idx = positions[keep], query_idx[keep]
+
+        results = [[] for _ in queries]
+        for idx, relation in zip(query_idx.tolist(), self.relations(positions)):
+            results[idx].append(relation)
+
+        return results
+
+    # Entities within k hops of an entity as {entity: hops}, direction is 'out', 'in' or 'both'
+    def k_hop(self, entity, k=2, direction='both', max_nodes=None):
+        node_id = self.node_id(entity)
+        if node_id is None:
+            return dict()
+
+        visited = np.zeros(self.num_nodes, dtype=bool)
+        visited[node_id] = True
+        frontier = np.array([node_id])
+        hops = {node_id: 0}
+
+        for hop in range(1, k + 1):
+            neighbours = np.concatenate([nodes for nodes, _ in self.expand(frontier, direction)])
+            frontier = np.unique(neighbours[~visited[neighbours]])
+            if max_nodes is not None:
+                frontier = frontier[:max(max_nodes - len(hops), 0)]
+            if len(frontier) == 0:
+                break
+
+            visited[frontier] = True
+            hops.update(dict.fromkeys(frontier.tolist(), hop))
+
+        return {self.node_names[node]: hop for node, hop in hops.items()}
+
+    # Shortest path of at most max_hops edges between two entities as a list of (subject, verb, object, weight)
+    # tuples, or None if there isn't one. With direction='both' edges can be followed against their direction.
+    def shortest_path(self, source, target, max_hops=4, direction='both'):
+        source_id, target_id = self.node_id(source), self.node_id(target)
+        if source_id is None or target_id is None:
+            return None
+        if source_id == target_id:
+            return []
+
+        visited = np.zeros(self.num_nodes, dtype=bool)
+        visited[source_id] = True
+        frontier = np.array([source_id])
+        # node -> forward edge position it was reached through
+        parents = dict()
+
+        for _ in range(max_hops):
+            next_frontier = []
+            for nodes, positions in self.expand(frontier, direction):
+                new = ~visited[nodes]
+                nodes, first = np.unique(nodes[new], return_index=True)
+                visited[nodes] = True
+                parents.update(zip(nodes.tolist(), positions[new][first].tolist()))
+                next_frontier.append(nodes)
+
+            if visited[target_id]:
+                return self.path_to(target_id, source_id, parents)
+
+            frontier = np.concatenate(next_frontier)
+            if len(frontier) == 0:
+                break
+
+        return None
+
+    def shortest_paths_batch(self, pairs, max_hops=4, direction='both'):
+        return [self.shortest_path(source, target, max_hops, direction) for source, target in pairs]
+
+    # Neighbours of the frontier nodes per direction, as (neighbour ids, forward edge positions) arrays
+    def expand(self, frontier, direction):
+        if direction in ('out', 'both'):
+            positions, _ = self.edge_positions(frontier, 'out')
+            yield self.column('targets', positions), positions
+        if direction in ('in', 'both'):
+            positions, _ = self.edge_positions(frontier, 'in')
+            yield self.column('sources', positions), positions
+
+    # Walk the parent edges back from the target to the source
+    def path_to(self, target_id, source_id, parents):
+        path = []
+        node = target_id
+        while node != source_id:
+            position = parents[node]
+            path.append(position)
+            source, target = (int(self.column(name, np.array([position]))[0]) for name in ('sources', 'targets'))
+            # The edge may have been followed in either direction
+            node = source if target == node else target
+
+        return self.relations(np.array(path[::-1], dtype=np.int64))
+
+    # Forward edge positions as (subject, verb, object, weight) tuples
+    def relations(self, positions):
+        names, labels = self.node_names, self.label_names
+        return [(names[source], labels[label_id], names[target], weight) for source, target, label_id, weight
+                in zip(self.column('sources', positions).tolist(), self.column('targets', positions).tolist(),
+                       self.column('label_ids', positions).tolist(), self.column('weights', positions).tolist())]
+
+# CSR index of edges by key (source, target or label id) as (offsets, edge positions, first edge position), the
+# in-memory counterpart of write_edge_index
+def build_index(keys, num_keys, first):
+    offsets = np.zeros(num_keys + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys, minlength=num_keys), out=offsets[1:])
+    return offsets, np.argsort(keys, kind='stable'), first
+
+# Concatenated positions offsets[key]:offsets[key + 1] of all the keys, without a Python loop, and for each of them
+# the position of its key in keys
+def gather(offsets, keys):
+    starts = offsets[keys]
+    lengths = offsets[keys + 1] - starts
+    if len(lengths) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    shifts = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return shifts + np.arange(lengths.sum()), np.repeat(np.arange(len(keys)), lengths)
@@ -0,0 +1,141 @@
+from source.graph_export import SNAPSHOT_VERSION
+import numpy as np
+import bisect
+import json
+import os
+
+class StringTable:
+    # Read-only view of a string table written by write_string_table. The blob is memory-mapped and strings are
+    # only decoded when they are accessed; lookups by value use binary search over the sorted ids.
+
+    def __init__(self, path) -> None:
+        self.offsets = np.load(f'{path}_offsets.npy', mmap_mode='r')
+        self.order = np.load(f'{path}_order.npy', mmap_mode='r')
+        # np.memmap can't map an empty file
+        if os.path.getsize(f'{path}.bin') > 0:
+            self.blob = np.memmap(f'{path}.bin', dtype=np.uint8, mode='r')
+        else:
+            self.blob = np.empty(0, dtype=np.uint8)
+        self.sorted_view = SortedStrings(self)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    # Drop the memory maps, the files are unmapped once nothing else refers to them
+    def close(self):
+        self.offsets = self.order = self.blob = None
+
+    def raw(self, string_id):
+        return self.blob[self.offsets[string_id]:self.offsets[string_id + 1]].tobytes()
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.raw(string_id).decode('utf-8') for string_id in range(*item.indices(len(self)))]
+
+        return self.raw(item).decode('utf-8')
+
+    def __iter__(self):
+        for string_id in range(len(self)):
+            yield self[string_id]
+
+    # Id of a string, or None if it isn't in the table
+    def index(self, string):
+        encoded = string.encode('utf-8')
+        position = bisect.bisect_left(self.sorted_view, encoded)
+        if position < len(self) and self.sorted_view[position] == encoded:
+            return int(self.order[position])
+
+        return None
+
+class SortedStrings:
+    # Sequence of the encoded strings in sorted order, as needed by bisect
+
+    def __init__(self, table) -> None:
+        self.table = table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __getitem__(self, position):
+        return self.table.raw(self.table.order[position])
+
+class GraphSnapshot:
+    # Knowledge graph loaded from a CSR snapshot (see CsrExporter) through memory maps. Nothing is copied into
+    # Python objects when it is opened, so it is ready to be queried straight away, and worker processes opening
+    # the same snapshot share a single copy of it through the page cache.
+
+    def __init__(self, path) -> None:
+        with open(f'{path}/meta.json', 'r', encoding='utf-8') as file:
+            self.meta = json.load(file)
+        if self.meta['version'] != SNAPSHOT_VERSION:
+            raise ValueError(f'Unsupported graph snapshot version {self.meta["version"]} in {path}')
+
+        self.path = path
+        self.offsets = np.load(f'{path}/offsets.npy', mmap_mode='r')
+        self.sources = np.load(f'{path}/sources.npy', mmap_mode='r')
+        self.indices = np.load(f'{path}/indices.npy', mmap_mode='r')
+        self.weights = np.load(f'{path}/weights.npy', mmap_mode='r')
+        self.label_ids = np.load(f'{path}/labels.npy', mmap_mode='r')
+        # Positions of the edges grouped by target node and by label, see write_edge_index
+        self.reverse_offsets = np.load(f'{path}/reverse_offsets.npy', mmap_mode='r')
+        self.reverse_edges = np.load(f'{path}/reverse_edges.npy', mmap_mode='r')
+        self.label_offsets = np.load(f'{path}/label_offsets.npy', mmap_mode='r')
+        self.label_edges = np.load(f'{path}/label_edges.npy', mmap_mode='r')
+        self.node_names = StringTable(f'{path}/nodes')
+        self.label_names = StringTable(f'{path}/labels')
+
+    # Drop the memory maps, e.g. before the snapshot directory is replaced
+    def close(self):
+        self.offsets = self.sources = self.indices = self.weights = self.label_ids = None
+        self.reverse_offsets = self.reverse_edges = self.label_offsets = self.label_edges = None
+        self.node_names.close()
+        self.label_names.close()
+
+    @property
+    def num_nodes(self):
+        return len(self.node_names)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def node_id(self, name):
+        return self.node_names.index(name)
+
+    def label_id(self, verb):
+        return self.label_names.index(verb)
+
+    def degree(self, node_id):
+        return int(self.offsets[node_id + 1] - self.offsets[node_id])
+
+    # Outgoing edges of a node as (target ids, label ids, weights) views of the snapshot
+    def out_edges(self, node_id):
+        start, end = self.offsets[node_id], self.offsets[node_id + 1]
+        return self.indices[start:end], self.label_ids[start:end], self.weights[start:end]
+
+    # Outgoing relations of an entity as (subject, verb, object, weight) tuples
+    def relations(self, subject):
+        node_id = self.node_id(subject)
+        if node_id is None:
+            return []
+
+        targets, label_ids, weights = self.out_edges(node_id)
+        return [(subject, self.label_names[label_id], self.node_names[target], float(weight))
+                for target, label_id, weight in zip(targets.tolist(), label_ids.tolist(), weights.tolist())]
+
+    # Iterate over the relations as (subject, verb, object, weight) tuples, in the same way as ColumnarKnowledgeGraph
+    def __iter__(self):
+        for node_id in range(self.num_nodes):
+            targets, label_ids, weights = self.out_edges(node_id)
+            subject = self.node_names[node_id]
+            for target, label_id, weight in zip(targets.tolist(), label_ids.tolist(), weights.tolist()):
+                yield subject, self.label_names[label_id], self.node_names[target], float(weight)
+
+    # Yield the edges as (first edge id, sources, targets, label ids, weights) chunks, so a snapshot can be exported
+    def edge_chunks(self, chunk_size=1000000):
+        for start in range(0, len(self), chunk_size):
+            end = min(start + chunk_size, len(self))
+            yield start, np.asarray(self.sources[start:end]), np.asarray(self.indices[start:end]), \
+                np.asarray(self.label_ids[start:end]), np.asarray(self.weights[start:end])
+
+def snapshot_path(working_dir):
+    return f'{working_dir}/source/graph/graph_snapshot'
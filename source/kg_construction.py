@@ -1,26 +1,61 @@
-from source.knowledge_graph import KnowledgeGraph
-from disambiguation import WikiDisambiguation
-from source.ner import Flair, Gate, Spacy
+from source.knowledge_graph import ColumnarKnowledgeGraph, KnowledgeGraph
+from source.graph_export import CsrExporter
+from source.graph_delta import IncrementalGraph, load_graph
+from source.graph_snapshot import snapshot_path
+from source.claim_matching.service import ClaimMatcher, MicroBatcher, benchmark, serve
+from source.entity_matcher import EntityMatcher
+from source.sharding import ShardWriter, attach_documents, load_documents, load_lines, load_manifest
+from source.openie import OpenIEPool
+from source.triple_cache import TripleCache
+from source.triple_store import TripleStoreWriter, read_triples, store_path
+from source.disambiguation.wiki_disambiguation import WikiDisambiguation
+from source.disambiguation.alias_index import AliasIndex
+from source.ner import Flair, Gate, NerEnsemble, Spacy
 from source.topic_modelling.lda import LDA
-from source.utils import silent_remove
+from source.topic_modelling.sweep import LDASweep
+from source.topic_modelling.online import OnlineLDA
+from gensim.models import LdaModel
+from source.utils import document_key, silent_remove
 from source.yodie import Yodie
+from source.api_client import ApiClient
+from source.response_cache import ResponseCache
 from source.utils import Mode
 from tqdm import tqdm
 import pandas as pd
-import subprocess
 import nltk
+import shutil
+import time
+import csv
 import os
 
 
 class KGConstruction:
-    def __init__(self, working_dir, stanford_path, api_key, api_password, mode, prepare_files) -> None:
+    def __init__(self, working_dir, stanford_path, api_key, api_password, mode, prepare_files, compact_graph=True,
+                 rows_per_shard=1000, bytes_per_shard=None, openie_workers=1, openie_memory='8g', openie_urls=None,
+                 api_rate=1.0, api_workers=4, alias_dump=None, min_confidence=None) -> None:
         self.working_dir = working_dir
         self.stanford_path = stanford_path
         self.api_key = api_key
         self.api_password = api_password
         self.mode = mode
         self.prepare_files = prepare_files
+        self.compact_graph = compact_graph
+        self.rows_per_shard = rows_per_shard
+        self.bytes_per_shard = bytes_per_shard
+        # Number of CoreNLP workers to keep warm (each with an openie_memory heap), or the urls of already running
+        # CoreNLP servers
+        self.openie_workers = openie_workers
+        self.openie_memory = openie_memory
+        self.openie_urls = openie_urls
+        # GATE Cloud client shared by GATE NER and YODIE, api_rate is the request quota per second
+        self.api_cache = ResponseCache(f'{working_dir}/source/cache/api_responses.sqlite')
+        self.api_client = ApiClient(api_key, api_password, rate=api_rate, max_workers=api_workers, cache=self.api_cache)
+        # Optional alias dump (alias, entity id, count per line) used for offline entity linking
+        self.alias_dump = alias_dump
+        # Triples below this OpenIE confidence are skipped when the triple store is read
+        self.min_confidence = min_confidence
         nltk.download('omw-1.4')
+        nltk.download('punkt')
 
     def run(self):
         if self.prepare_files:
@@ -40,174 +75,164 @@ class KGConstruction:
                 filenames = self.covid_misinfo()
                 output_name = 'openie_output_covid_claims'
 
-        # Convert the output of OpenIE to a csv file
+        # Load the triples merged from the OpenIE output and the triple cache, rows with an empty subject,
+        # verb or object were already dropped when the store was written
         output_name = 'openie_output_ukraine_claims'
-        output_data = pd.read_csv(f'{self.working_dir}/source/output_files/{output_name}.txt', encoding='ISO-8859-1',
-                                  sep='\t', names=['Confidence', 'Subject', 'Verb', 'Object'])
-        output_data.to_csv(
-            f'{self.working_dir}/source/output_files/{output_name}.csv')
-
-        # Remove rows with empty subject, object or verb
-        output_data = output_data[output_data['Subject'].notnull()]
-        output_data = output_data[output_data['Object'].notnull()]
-        output_data = output_data[output_data['Verb'].notnull()]
+        output_data = read_triples(store_path(self.working_dir, output_name), min_confidence=self.min_confidence)
 
         if self.mode == Mode.LDA:
             self.perform_lda(output_data)
+        elif self.mode == Mode.SERVE:
+            self.serve_claims(output_data)
+        elif self.mode == Mode.LDA_UPDATE:
+            self.update_lda(output_data)
         elif self.mode == Mode.DISAMBIGUATION:
-            get_disambiguated_entities(output_data)
+            self.wiki_disambiguation(output_data, 'summary')
         elif self.mode == Mode.CONSTRUCTION:
             # -------------------- NER --------------------
             # Extract named entities from the data using various NER packages
-            ne_dict = dict()
-
-            spacy = Spacy()
-            ne_dict = self.extract_ne(spacy, ne_dict, filenames)
-
-            flair = Flair()
-            ne_dict = self.extract_ne(flair, ne_dict, filenames)
-
-            gate = Gate(self.api_key, self.api_password)
-            ne_dict = self.extract_ne(gate, ne_dict, filenames)
+            # The corpus is loaded once and the backends run concurrently on it
+            sentences = self.load_corpus(filenames)
+            ner = NerEnsemble({
+                'spaCy': Spacy(),
+                'Flair': Flair(),
+                'GATE': Gate(self.api_key, self.api_password, client=self.api_client)
+            })
+            ne_dict, ne_votes = ner.get_entities(sentences)
+            self.export_entities(ne_dict, ne_votes)
 
             # -------------------- Entity Linking --------------------
             # Entity linking DBpedia
             ne_links = self.ne_disambiguation(ne_dict.keys())
             print(ne_links)
+            print(f'GATE Cloud response cache: {self.api_cache.stats()}')
 
             # -------------------- Knowledge Graph --------------------
-            knowledge_graph = KnowledgeGraph()
+            # The columnar graph keeps edges in NumPy arrays, which uses far less memory at scale
+            if self.compact_graph:
+                knowledge_graph = ColumnarKnowledgeGraph()
+            else:
+                knowledge_graph = KnowledgeGraph()
+
+            # Find the named entities in every subject with a single pass of the Aho-Corasick automaton
+            matcher = EntityMatcher(ne_dict.keys())
 
-            for row in output_data.iterrows():
-                for ne in ne_dict:
-                    # TODO Different ways to align the NER and triples?
-                    if ne in row['Subject'] and row['Object'] in ne_dict:
-                        knowledge_graph.add_relation(
-                            row['Subject'], row['Verb'], row['Object'])
+            for row in output_data.itertuples(index=False):
+                # TODO Different ways to align the NER and triples?
+                if row.Object in ne_dict and matcher.find(row.Subject):
+                    knowledge_graph.add_relation(row.Subject, row.Verb, row.Object)
 
+            # Gephi files for inspection and a binary CSR snapshot for the downstream consumers, which is kept
+            # outside of output_files so that it survives clean_up_files
             knowledge_graph.export_csv(self.working_dir)
+            # The snapshot records the (content keys of the) documents it was built from, later runs can then add
+            # only new documents
+            CsrExporter(os.path.dirname(snapshot_path(self.working_dir)),
+                        meta={'documents': sorted(output_data['DocumentKey'].astype(str).unique().tolist())}) \
+                .export(knowledge_graph, 1000000)
+        elif self.mode == Mode.GRAPH_UPDATE:
+            self.update_graph(output_data)
 
         return None
 
-    def prepare_data(self, data, column_name):
-        # Filter for a specific column
-        data = data[[f'{column_name}']]
-        data = data.reset_index()
-
-        # Split the data into smaller batches so they can be passed to Stanford's package
-        # This is to avoid using too much memory at once
-        filenames = []
-        file_idx = 0
-
-        # Make sure a new file is created to avoid appending to the output from previous run
-        new_filename = f'{self.working_dir}\source\input_files\\{column_name}_{file_idx}.txt'
-        silent_remove(new_filename)
-        file = open(new_filename, 'a', encoding='utf-8')
-        filenames.append(new_filename)
-
-        # Get column data
-        for idx, row in tqdm(data.iterrows()):
-            # Make sure to ignore NaN values
-            if isinstance(row[f'{column_name}'], str):
-                cell = row[f'{column_name}'].strip().replace('\n', ' ')
-                file.write(f'{cell}. Dummy is a dummy.\n')
-
-                if (idx + 1) % 1 == 0:
-                    file.close()
-                    file_idx += 1
-
-                    new_filename = f'{self.working_dir}\source\input_files\\{column_name}_{file_idx}.txt'
-                    silent_remove(new_filename)
-
-                    file = open(new_filename, 'a', encoding='utf-8')
-                    filenames.append(new_filename)
-
-        # Create filelist
-        filelist_path = f'{self.working_dir}\source\input_files\\filelist.txt'
-        silent_remove(filelist_path)
-        with open(filelist_path, 'a') as file:
-            for filename in filenames:
-                file.write(f'{filename}\n')
-
-        return filenames
+    # Returns the OpenIE shards holding only the records missing from the cache, the NER corpus files with
+    # every record, the cache key of every record and its content-based document key
+    def prepare_data(self, data, column_name, cache):
+        # Stream the column into shards so they can be passed to Stanford's package
+        # This is to avoid using too much memory at once, without creating a file for every row
+        input_dir = f'{self.working_dir}/source/input_files'
+        keys = dict()
+        document_keys = dict()
+
+        with ShardWriter(input_dir, column_name, self.rows_per_shard, self.bytes_per_shard) as writer, \
+                ShardWriter(input_dir, f'{column_name}_corpus', rows_per_shard=None, filelist_name=None) as corpus:
+            for record_id, cell in tqdm(data[column_name].items()):
+                # Make sure to ignore NaN values
+                if isinstance(cell, str):
+                    corpus.write(record_id, cell)
+                    keys[record_id] = cache.key(cell)
+                    # Unlike the cache key it doesn't change with the OpenIE settings
+                    document_keys[record_id] = document_key(cell)
+
+                    # Unchanged records already have their triples in the cache
+                    if keys[record_id] not in cache:
+                        writer.write(record_id, cell)
+
+        return writer.filenames, corpus.filenames, keys, document_keys
+
+    # Read the OpenIE output (reverb format) and attach the source document of every triple from the shard manifest
+    def load_triples(self, output_name, column_name):
+        columns = ['Shard', 'Line', 'Subject', 'Verb', 'Object', 'Confidence']
+        try:
+            output_data = pd.read_csv(f'{self.working_dir}/source/output_files/{output_name}.txt', encoding='utf-8',
+                                      sep='\t', header=None, quoting=csv.QUOTE_NONE, usecols=[0, 1, 2, 3, 4, 11],
+                                      names=columns)
+        except pd.errors.EmptyDataError:
+            # OpenIE didn't find any triples
+            output_data = pd.DataFrame(columns=columns)
+        manifest = load_manifest(f'{self.working_dir}/source/input_files', column_name)
+        output_data = attach_documents(output_data, manifest)
+
+        return output_data[['Confidence', 'Subject', 'Verb', 'Object', 'Document', 'Sentence']]
 
     # Use OpenIE to extract the triples from the Russo-Ukrainian war misinformation data
     def ukraine_misinfo(self):
         # Retrieve the misinformation data
         data = pd.read_json(
-            f'{self.working_dir}\source\\resources\stratcom-data.json')
-        filenames = self.prepare_data(data, 'summary')
-
-        # Run the Stanford CoreNLP java package over all previously created files
-        args = ['java', '-mx8g', '-cp', self.stanford_path, 'edu.stanford.nlp.naturalli.OpenIE',
-                '-filelist', f'{self.working_dir}\source\input_files\\filelist.txt',
-                '-output', f'{self.working_dir}\source\output_files\openie_output_ukraine_claims.txt',
-                '-tokenize.options', 'untokenizable=noneDelete', '-max_entailments_per_clause', '1']
-        args = ' '.join(args)
-
-        self.process = subprocess.Popen(
-            args, shell=True, stderr=subprocess.STDOUT).wait()
+            f'{self.working_dir}/source/resources/stratcom-data.json')
 
-        return filenames
+        return self.extract_triples(data, [('summary', 'openie_output_ukraine_claims')],
+                                    {'openie.max_entailments_per_clause': '1'})
 
     # Use OpenIE to extract the triples from covid-19 misinformation data
     def covid_misinfo(self):
         # Retrieve the misinformation data
         data = pd.read_json(
-            f'{self.working_dir}\source\\resources\IFCN_COVID19_12748.json')
-
-        # Prepare and process claims
-        filenames = self.prepare_data(data, 'Claim')
-
-        args = ['java', '-mx8g', '-cp', self.stanford_path, 'edu.stanford.nlp.naturalli.OpenIE', '-filelist',
-                f'{self.working_dir}\source\input_files\\filelist.txt', '-output',
-                f'{self.working_dir}\source\output_files\openie_output_covid_claims.txt', '-tokenize.options', 'untokenizable=noneDelete']
-        args = ' '.join(args)
+            f'{self.working_dir}/source/resources/IFCN_COVID19_12748.json')
 
-        self.process = subprocess.Popen(
-            args, shell=True, stderr=subprocess.STDOUT).wait()
+        # Process claims and explanations
+        return self.extract_triples(data, [('Claim', 'openie_output_covid_claims'),
+                                           ('Explaination', 'openie_output_covid_explanations')])
 
-        # Prepare and process explanations
-        filenames = filenames + self.prepare_data(data, 'Explaination')
-
-        args = ['java', '-mx8g', '-cp', self.stanford_path, 'edu.stanford.nlp.naturalli.OpenIE', '-filelist',
-                f'{self.working_dir}\source\input_files\\filelist.txt', '-output',
-                f'{self.working_dir}\source\output_files\openie_output_covid_explanations.txt', '-tokenize.options', 'untokenizable=noneDelete']
-        args = ' '.join(args)
+    # Run OpenIE only over the records missing from the triple cache, then write the triples of all
+    # records in document order to the {output_name}.parquet triple store
+    def extract_triples(self, data, columns, properties=None):
+        pool = self.openie_pool(properties)
+        cache = TripleCache(f'{self.working_dir}/source/cache/openie_triples.sqlite', pool.properties)
+        filenames = []
 
-        self.process = subprocess.Popen(
-            args, shell=True, stderr=subprocess.STDOUT).wait()
+        try:
+            for column_name, output_name in columns:
+                shard_filenames, corpus_filenames, keys, document_keys = self.prepare_data(data, column_name, cache)
+                filenames += corpus_filenames
+                print(f'{len(keys)} records in {column_name}, {len(shard_filenames)} shards need OpenIE')
+
+                # The CoreNLP workers are only started (and then kept warm) if there is anything to extract
+                if shard_filenames:
+                    new_keys = {record_id: key for record_id, key in keys.items() if key not in cache}
+                    pool.start()
+                    pool.extract(shard_filenames, f'{self.working_dir}/source/output_files/{output_name}.txt')
+                    cache.update(self.load_triples(output_name, column_name), new_keys)
+
+                with TripleStoreWriter(store_path(self.working_dir, output_name)) as store:
+                    store.write(cache.collect(keys, document_keys))
+        finally:
+            pool.stop()
+            cache.close()
 
         return filenames
 
+    def openie_pool(self, properties=None):
+        return OpenIEPool(self.stanford_path, num_workers=self.openie_workers, memory=self.openie_memory,
+                          urls=self.openie_urls, properties=properties)
+
     # Perform LDA with BOW, Triples, and SVO models
     def perform_lda(self, output_data):
-        triples = list()
-        subjects = list()
-        objects = list()
-        verbs = list()
-        doc_triples = list()
-        doc_subjects = list()
-        doc_objects = list()
-        doc_verbs = list()
-
-        for row in output_data.itertuples():
-            if row[2] == 'Dummy':
-                triples.append(doc_triples)
-                subjects.append(doc_subjects)
-                objects.append(doc_objects)
-                verbs.append(doc_verbs)
-                doc_triples = list()
-                doc_subjects = list()
-                doc_objects = list()
-                doc_verbs = list()
-                continue
-            doc_triples.append(row[2] + ' ' + row[3] + ' ' + row[4])
-            doc_subjects.append(row[2])
-            doc_objects.append(row[4])
-            doc_verbs.append(row[3])
-
-        lda = LDA(triples, subjects, objects, verbs)
+        # Stream the triples grouped by the document they were extracted from
+        documents = (zip(doc['Subject'], doc['Verb'], doc['Object'])
+                     for _, doc in output_data.groupby('Document', sort=False))
+
+        lda = LDA(documents, f'{self.working_dir}/source/output_files/lda_corpora')
 
         # Remove the old output file before staring the LDA process
         silent_remove(
@@ -217,11 +242,29 @@ class KGConstruction:
             15, 1], [16, 1], [17, 1], [18, 1], [19, 1], [20, 1]]
         # args =  [[1, 1], [2, 1], [3, 1], [4, 1], [5, 1], [6, 1], [7, 1], [8, 1], [9, 1], [10, 1], [11, 1], [12, 1], [13, 1], [14, 1], [15, 1], [16, 1], [17, 1], [18, 1], [19, 1], [20, 1], [21, 1], [22, 1], [23, 1], [24, 1], [25, 1], [26, 1], [27, 1], [28, 1], [29, 1], [30, 1], [31, 1], [32, 1], [33, 1], [34, 1], [35, 1], [36, 1], [37, 1], [38, 1], [39, 1], [40, 1], [41, 1], [42, 1], [43, 1], [44, 1], [45, 1], [46, 1], [47, 1], [48, 1], [49, 1], [50, 1]]
 
-        # LDA performed on triples
-        coherence, lda_model = lda.get_topics_triple(num_topics=13, passes=1)
+        # LDA performed on triples, all grid points are trained in parallel and the most coherent model is kept
+        sweep = LDASweep(lda.corpus_triple, lda.dictionary_triple, lda.triples,
+                         f'{self.working_dir}/source/output_files/lda_sweep', 'triples')
+        results = sweep.run([{'num_topics': arg[0], 'passes': arg[1]} for arg in args])
+        results.to_csv(f'{self.working_dir}/source/output_files/lda_sweep_triples.csv', index=False)
+
+        for row in results.itertuples(index=False):
+            lda.print_topics(LdaModel.load(row.model_path),
+                             f'Triples - Topics = {row.num_topics}, Alpha = {row.alpha}, Passes = {row.passes}', row.coherence)
+
+        lda_model = LdaModel.load(results.loc[0, 'model_path'])
         lda_model.save(f'{self.working_dir}\source\output_files\lda_model')
-        # coherence_scores_1, lda_model = [lda.get_topics_triple(num_topics=arg[0], passes=1, workers=2) for arg in args]
-        # coherence_scores_50 = [lda.get_topics_bow(num_topics=arg[0], passes=50, workers=2) for arg in args]
+
+        # Keep the model, its dictionary and the documents it has seen so it can be updated online later
+        model_dir = f'{self.working_dir}/source/models'
+        os.makedirs(model_dir, exist_ok=True)
+        lda_model.save(f'{model_dir}/lda_model')
+        lda.dictionary_triple.save(f'{model_dir}/lda_dictionary')
+        # Documents are told apart by their content key, as their position in the source data can change between runs
+        pd.Series(output_data['DocumentKey'].astype(str).unique()).to_csv(f'{model_dir}/lda_documents.txt', index=False,
+                                                                          header=False)
+        # coherence_scores_1 = [coherence for coherence, _ in lda.get_topics_grid('triple', [(arg[0], 1) for arg in args], workers=2)]
+        # coherence_scores_50 = [coherence for coherence, _ in lda.get_topics_grid('bow', [(arg[0], 50) for arg in args], workers=2)]
 
         # Plot coherence scores as 3 different lines depending on number of passes for number of topics from 1-50
         # plt.plot([arg[0] for arg in args], coherence_scores_1, label='Triples: 1 Pass')
@@ -234,45 +277,157 @@ class KGConstruction:
         # plt.clf()
 
         # LDA performed on SVO separately
-        # [lda.get_topics_svo(num_topics=arg[0], passes=arg[1], workers=2) for arg in args]
+        # [lda.get_topics_grid(view, args, workers=2) for view in ('subject', 'verb', 'object')]
 
         # LDA performed on BOW
-        # [lda.get_topics_bow(num_topics=arg[0], passes=arg[1], workers=2) for arg in args]
+        # lda.get_topics_grid('bow', args, workers=2)
+
+    # Add the triples of the documents that are not in the graph yet to the last snapshot as a delta; the corpus is
+    # only run through NER for the new documents
+    def update_graph(self, output_data, column_name='summary'):
+        graph = IncrementalGraph(os.path.dirname(snapshot_path(self.working_dir)))
+        # Documents are told apart by their content, as their position in the source data can change between runs
+        new_data = output_data[~output_data['DocumentKey'].isin(graph.documents)]
+        if new_data.empty:
+            print('No new documents to add to the knowledge graph')
+            return None
+
+        new_documents = new_data['Document'].unique()
+        sentences = [line for _, line in load_lines(f'{self.working_dir}/source/input_files', f'{column_name}_corpus',
+                                                     set(new_documents))]
+        ner = NerEnsemble({
+            'spaCy': Spacy(),
+            'Flair': Flair(),
+            'GATE': Gate(self.api_key, self.api_password, client=self.api_client)
+        })
+        ne_dict, _ = ner.get_entities(sentences)
+
+        # Entities already linked into the graph count as well as the ones found in the new documents
+        entities = set(ne_dict.keys()) | graph.object_names()
+        matcher = EntityMatcher(entities)
+        relations = [(row.Subject, row.Verb, row.Object) for row in new_data.itertuples(index=False)
+                     if row.Object in entities and matcher.find(row.Subject)]
+
+        graph.apply(relations, new_data['DocumentKey'].astype(str).unique().tolist())
+        print(f'Added {len(relations)} relations from {len(new_documents)} new documents to the knowledge graph')
+
+        return None
 
-    def extract_ne(self, ner, ne_dict, filenames):
+    # Update the saved LDA model with the documents it has not seen yet and assign them to topics
+    def update_lda(self, output_data):
+        model_dir = f'{self.working_dir}/source/models'
+        # Content keys of the documents the model has seen
+        seen = set(pd.read_csv(f'{model_dir}/lda_documents.txt', header=None, dtype=str)[0])
+        new_data = output_data[~output_data['DocumentKey'].isin(seen)]
+        if new_data.empty:
+            print('No new documents to update the LDA model with')
+            return None
+
+        groups = new_data.groupby('Document', sort=False)
+        online_lda = OnlineLDA(f'{model_dir}/lda_model', f'{model_dir}/lda_dictionary')
+        texts = online_lda.tokenise(zip(doc['Subject'], doc['Verb'], doc['Object']) for _, doc in groups)
+
+        num_new_terms = online_lda.extend_vocabulary(texts)
+        num_updated = online_lda.update(texts)
+        print(f'LDA model updated with {num_updated} documents and {num_new_terms} new terms')
+
+        topics, probabilities = online_lda.assign_topics(texts)
+        pd.DataFrame({'Document': list(groups.groups.keys()), 'Topic': topics, 'Probability': probabilities}) \
+            .to_csv(f'{self.working_dir}/source/output_files/lda_new_topics.csv', index=False)
+
+        online_lda.save(f'{model_dir}/lda_model', f'{model_dir}/lda_dictionary')
+        new_keys = new_data['DocumentKey'].astype(str).unique().tolist()
+        pd.Series(sorted(seen) + new_keys).to_csv(f'{model_dir}/lda_documents.txt', index=False, header=False)
+
+        return None
+
+    # Load the graph snapshot and the triple embeddings once, report the matching latency and serve claims over HTTP
+    def serve_claims(self, output_data, column_name='summary', port=8080):
+        documents = load_documents(f'{self.working_dir}/source/input_files', f'{column_name}_corpus')
+        matcher = ClaimMatcher(load_graph(self.working_dir), output_data, documents,
+                               embedding_dir=f'{self.working_dir}/source/cache/embeddings')
+        batcher = MicroBatcher(matcher.match_batch)
+
+        # Replay known claims as concurrent requests to measure the latency
+        print(f'Claim matching latency (ms): {benchmark(batcher, list(documents.values())[:500])}')
+
+        serve(batcher, port=port)
+        batcher.close()
+
+        return None
+
+    def load_corpus(self, filenames):
         sentences = []
 
         # Get the sentences from input files
         for filename in filenames:
-            with open(filename, 'r', encoding='utf-8') as file:
+            with open(filename, 'r', encoding='utf-8', newline='') as file:
                 for line in file:
                     sentences.append(line)
 
-        # Get the entities from the sentences
-        entities = ner.get_entities(sentences)
+        return sentences
 
-        for ne in entities:
-            if ne in ne_dict:
-                ne_dict[ne] += 1
-            else:
-                ne_dict[ne] = 1
+    # Write the named entities with their total count and the votes from every NER backend
+    def export_entities(self, ne_dict, ne_votes):
+        entities_df = pd.DataFrame([{'Entity': ne, 'Count': count, **ne_votes[ne]} for ne, count in ne_dict.items()])
+        entities_df = entities_df.fillna(0)
+        entities_df.to_csv(f'{self.working_dir}/source/output_files/named_entities.csv', index=False)
 
-        return ne_dict
+        return None
 
     def ne_disambiguation(self, entities):
-        # Call GATE Yodie
-        yodie = Yodie(self.api_key, self.api_password)
         yodie_outputs = {}
+        entities = list(entities)
 
         print('Disambiguating NEs...')
-        for entity in tqdm(entities):
-            entity_link = yodie.call(entity)
+        # First tier: the offline alias index, only the misses are sent to the remote service
+        if self.alias_dump is not None:
+            alias_index = AliasIndex.from_dump(self.alias_dump)
+
+            misses = []
+            start = time.perf_counter()
+            for entity in entities:
+                entity_id = alias_index.link(entity)
+                if entity_id is not None:
+                    yodie_outputs[entity] = entity_id
+                else:
+                    misses.append(entity)
+            elapsed = time.perf_counter() - start
+            print(f'Alias index linked {len(entities) - len(misses)} of {len(entities)} entities '
+                  f'({len(entities) / max(elapsed, 1e-9):.0f} lookups/sec)')
+            entities = misses
+
+        # Call GATE Yodie
+        yodie = Yodie(self.api_key, self.api_password, client=self.api_client)
+
+        # Entities are packed into a few large requests instead of one request each
+        for entity_link in yodie.call_batch(entities).values():
             if entity_link:
                 yodie_outputs[entity_link[0][1]] = entity_link[0][0]
         print()
 
         return yodie_outputs
 
+    # Link the subjects and objects of the triples to Wikipedia pages, using the claims they come from as context
+    def wiki_disambiguation(self, output_data, column_name):
+        documents = load_documents(f'{self.working_dir}/source/input_files', f'{column_name}_corpus')
+
+        entities = dict()
+        for row in output_data.itertuples(index=False):
+            for entity in (row.Subject, row.Object):
+                if entity not in entities:
+                    entities[entity] = documents.get(row.Document, entity)
+
+        disambiguation = WikiDisambiguation(entities.keys(), entities.values(),
+                                            store_path=f'{self.working_dir}/source/cache/wikipedia.sqlite',
+                                            embedding_dir=f'{self.working_dir}/source/cache/embeddings')
+
+        disambiguated_df = pd.DataFrame({'Entity': list(entities.keys()),
+                                         'Wikipedia': disambiguation.get_disambiguated_entities()})
+        disambiguated_df.to_csv(f'{self.working_dir}/source/output_files/wiki_disambiguation.csv', index=False)
+
+        return disambiguated_df
+
     def clean_up_files(self):
         # Delete all files in input_files directory
         for filename in os.listdir(f'{self.working_dir}\source\input_files'):
@@ -280,5 +435,9 @@ class KGConstruction:
 
         # Delete all files in output_files directory
         for filename in os.listdir(f'{self.working_dir}\source\output_files'):
-            silent_remove(
-                f'{self.working_dir}\source\output_files\\{filename}')
+            # The LDA corpora and sweep models are kept in subdirectories
+            if os.path.isdir(f'{self.working_dir}\source\output_files\\{filename}'):
+                shutil.rmtree(f'{self.working_dir}\source\output_files\\{filename}')
+            else:
+                silent_remove(
+                    f'{self.working_dir}\source\output_files\\{filename}')
@@ -1,10 +1,19 @@
-import pandas as pd
+from source.graph_export import export_graph
+import numpy as np
+import sys
 
 class KnowledgeGraph:
 
     def __init__(self) -> None:
         self.nodes = []
         self.edges = []
+        # Hash indexes so that lookups don't have to walk the whole graph
+        # node_index: name -> node id, edge_index: (source id, target id, label) -> edge id
+        self.node_index = dict()
+        self.edge_index = dict()
+        # Distinct edge labels, so exporters can write label ids instead of strings
+        self.label_names = []
+        self.label_index = dict()
 
     def add_relation(self, subject, verb, object):
         source = Node(subject, len(self.nodes))
@@ -13,6 +22,7 @@ class KnowledgeGraph:
         source = self.validate_node(source)
         if source.id == len(self.nodes):
             self.nodes.append(source)
+            self.node_index[source.name] = source.id
 
         target = Node(object, len(self.nodes))
 
@@ -20,30 +30,51 @@ class KnowledgeGraph:
         target = self.validate_node(target)
         if target.id == len(self.nodes):
             self.nodes.append(target)
-
-        relationship = Edge(source.id, target.id, verb, len(self.edges))
-        self.edges.append(relationship)
+            self.node_index[target.name] = target.id
+
+        # Merge duplicate relations by increasing the weight of the existing edge
+        edge_key = (source.id, target.id, verb)
+        edge_id = self.edge_index.get(edge_key)
+        if edge_id is None:
+            relationship = Edge(source.id, target.id, verb, len(self.edges))
+            self.edges.append(relationship)
+            self.edge_index[edge_key] = relationship.id
+            if verb not in self.label_index:
+                self.label_index[verb] = len(self.label_names)
+                self.label_names.append(verb)
+        else:
+            self.edges[edge_id].weight += 1.0
 
         return None
 
-    def export_csv(self, working_dir):
-        nodes_df = pd.DataFrame([{'Id': x.id, 'Label': x.name} for x in self.nodes])
-        nodes_df.to_csv(f'{working_dir}/source/output_files/nodes.csv', index=False)
-        
-        edges_df = pd.DataFrame([{'Source': x.source_id, 'Target': x.target_id, 'Type': x.type, 
-            'Id': x.id, 'Label': x.label, 'Weight': x.weight} for x in self.edges])
-        edges_df.to_csv(f'{working_dir}/source/output_files/edges.csv', index=False)
+    @property
+    def node_names(self):
+        return [node.name for node in self.nodes]
+
+    def __len__(self):
+        return len(self.edges)
+
+    # Yield the edges as (first edge id, sources, targets, label ids, weights) NumPy chunks
+    def edge_chunks(self, chunk_size=1000000):
+        for start in range(0, len(self.edges), chunk_size):
+            edges = self.edges[start:start + chunk_size]
+            yield (start, np.fromiter((x.source_id for x in edges), dtype=np.int32, count=len(edges)),
+                np.fromiter((x.target_id for x in edges), dtype=np.int32, count=len(edges)),
+                np.fromiter((self.label_index[x.label] for x in edges), dtype=np.int32, count=len(edges)),
+                np.fromiter((x.weight for x in edges), dtype=np.float32, count=len(edges)))
+
+    def export_csv(self, working_dir, chunk_size=1000000):
+        export_graph(self, f'{working_dir}/source/output_files', formats=('csv',), chunk_size=chunk_size)
 
         return None
     
     def validate_node(self, new_node):
-        result = new_node
+        node_id = self.node_index.get(new_node.name)
 
-        for node in self.nodes:
-            if new_node.name == node.name:
-                result = node
+        if node_id is not None:
+            return self.nodes[node_id]
 
-        return result
+        return new_node
 
 class Node:
 
@@ -59,5 +90,92 @@ class Edge:
         self.label = label
         self.id = id
         self.type = 'Directed'
-        # TODO Adjust the weight based on the amount of times same combination appears?
+        # Incremented by KnowledgeGraph.add_relation every time the same relation appears again
         self.weight = 1.0
+
+class ColumnarKnowledgeGraph:
+    # Compact alternative to KnowledgeGraph: node names and edge labels are interned once and
+    # edges are stored column-wise in NumPy arrays instead of one Node/Edge object each
+
+    def __init__(self, capacity=1024) -> None:
+        # Interned strings: id -> string and string -> id
+        self.node_names = []
+        self.node_index = dict()
+        self.label_names = []
+        self.label_index = dict()
+
+        # Edge columns, only the first num_edges entries are valid
+        self.num_edges = 0
+        self.sources = np.empty(capacity, dtype=np.int32)
+        self.targets = np.empty(capacity, dtype=np.int32)
+        self.label_ids = np.empty(capacity, dtype=np.int32)
+        self.weights = np.empty(capacity, dtype=np.float32)
+
+        # (source id, target id, label id) packed into a single int -> edge id
+        self.edge_index = dict()
+
+    def add_relation(self, subject, verb, object):
+        source_id = self.intern(subject, self.node_names, self.node_index)
+        target_id = self.intern(object, self.node_names, self.node_index)
+        label_id = self.intern(verb, self.label_names, self.label_index)
+
+        edge_key = (source_id << 64) | (target_id << 32) | label_id
+        edge_id = self.edge_index.get(edge_key)
+
+        # Merge duplicate relations by increasing the weight of the existing edge
+        if edge_id is not None:
+            self.weights[edge_id] += 1.0
+            return None
+
+        if self.num_edges == len(self.sources):
+            self.grow()
+
+        edge_id = self.num_edges
+        self.sources[edge_id] = source_id
+        self.targets[edge_id] = target_id
+        self.label_ids[edge_id] = label_id
+        self.weights[edge_id] = 1.0
+        self.edge_index[edge_key] = edge_id
+        self.num_edges += 1
+
+        return None
+
+    def intern(self, name, names, index):
+        name_id = index.get(name)
+
+        if name_id is None:
+            name_id = len(names)
+            name = sys.intern(name)
+            names.append(name)
+            index[name] = name_id
+
+        return name_id
+
+    # Double the capacity of the edge arrays
+    def grow(self):
+        capacity = max(2 * len(self.sources), 1)
+        self.sources = np.resize(self.sources, capacity)
+        self.targets = np.resize(self.targets, capacity)
+        self.label_ids = np.resize(self.label_ids, capacity)
+        self.weights = np.resize(self.weights, capacity)
+
+    def __len__(self):
+        return self.num_edges
+
+    # Iterate over the relations as (subject, verb, object, weight) tuples
+    def __iter__(self):
+        for edge_id in range(self.num_edges):
+            yield (self.node_names[self.sources[edge_id]], self.label_names[self.label_ids[edge_id]],
+                self.node_names[self.targets[edge_id]], float(self.weights[edge_id]))
+
+    # Yield the edges as (first edge id, sources, targets, label ids, weights) NumPy chunks, without copying them
+    def edge_chunks(self, chunk_size=1000000):
+        for start in range(0, self.num_edges, chunk_size):
+            end = min(start + chunk_size, self.num_edges)
+            yield start, self.sources[start:end], self.targets[start:end], self.label_ids[start:end], self.weights[start:end]
+
+    # Same output as KnowledgeGraph.export_csv, written in chunks straight from the edge arrays
+    def export_csv(self, working_dir, chunk_size=1000000):
+        export_graph(self, f'{working_dir}/source/output_files', formats=('csv',), chunk_size=chunk_size)
+
+        return None
@@ -1,13 +1,14 @@
-from ratelimit import limits, sleep_and_retry
 from flair.models import SequenceTagger
 from flair.data import Sentence
+from source.spacy_worker import load_spacy_model, spacy_batch_entities
+from source.api_client import ApiClient
+from concurrent.futures import ThreadPoolExecutor
 from abc import ABC, abstractmethod
 from tqdm import tqdm
-import requests
-import subprocess
-import spacy
+import multiprocessing
+import torch
 import json
-import sys
+import time
 
 class NamedEntityRecogniser(ABC):
 
@@ -15,47 +16,78 @@ class NamedEntityRecogniser(ABC):
     def get_entities(self, sentences):
         pass
 
+class NerEnsemble:
+    # Runs several NER backends at the same time over one in-memory corpus, each on its own executor, so the
+    # wall-clock time is close to the slowest backend. The local taggers (spaCy processes, Flair/torch) and the
+    # network-bound GATE client don't compete for the GIL for long, so threads are enough to drive them.
+    def __init__(self, recognisers):
+        # Backend name -> NamedEntityRecogniser
+        self.recognisers = recognisers
+
+    # Returns the entity counts and, for every entity, the number of votes from each backend
+    def get_entities(self, sentences):
+        executors = {name: ThreadPoolExecutor(max_workers=1) for name in self.recognisers}
+        try:
+            futures = {name: executors[name].submit(recogniser.get_entities, sentences)
+                       for name, recogniser in self.recognisers.items()}
+            results = {name: future.result() for name, future in futures.items()}
+        finally:
+            for executor in executors.values():
+                executor.shutdown()
+
+        ne_dict = dict()
+        ne_votes = dict()
+        for name, entities in results.items():
+            for ne in entities:
+                ne_dict[ne] = ne_dict.get(ne, 0) + 1
+                votes = ne_votes.setdefault(ne, dict())
+                votes[name] = votes.get(name, 0) + 1
+
+        return ne_dict, ne_votes
+
 class Spacy(NamedEntityRecogniser):
-    def __init__(self):
-        # Download the en_core_web_sm model
-        subprocess.check_call([sys.executable, "-m", "spacy", "download", "en_core_web_sm"])
+    def __init__(self, model='en_core_web_sm', batch_size=1000, n_process=None):
+        self.model = model
+        self.batch_size = batch_size
+        # Number of worker processes, by default up to 4 on half of the cores so that Flair (and the other backends
+        # of the ensemble) keep some for themselves; -1 uses all available cores
+        if n_process is None:
+            n_process = max(1, min(4, multiprocessing.cpu_count() // 2))
+        self.n_process = n_process if n_process > 0 else multiprocessing.cpu_count()
+        # Only the NER component is needed
+        self.disable = ['parser', 'tagger']
+        self.ignored_labels = ['TIME', 'PERCENT', 'MONEY', 'QUANTITY', 'ORDINAL', 'CARDINAL', 'DATE']
+
+        # Make sure the model is available (downloaded only if missing) and loaded in this process
+        load_spacy_model(self.model, self.disable)
 
     def get_entities(self, sentences): 
-        # Load the model
-        nlp = spacy.load('en_core_web_sm')
         entities = list()
-        ignored_labels = ['TIME', 'PERCENT', 'MONEY', 'QUANTITY', 'ORDINAL', 'CARDINAL', 'DATE']
+        batches = [(self.model, self.disable, self.ignored_labels, sentences[idx:idx + self.batch_size])
+                   for idx in range(0, len(sentences), self.batch_size)]
 
         print('Retrieving Named Entities with spaCy...')
-        for sentence in tqdm(sentences):
-            doc = nlp(sentence)
-            for ent in doc.ents:
-                if ent.label_ not in ignored_labels:
-                    entities.append(str(ent))
+        # Each worker process loads the model once and streams its batches through nlp.pipe
+        # Spawned rather than forked, so that the pool is safe to start while other backends run in threads
+        if self.n_process > 1:
+            with multiprocessing.get_context('spawn').Pool(self.n_process) as pool:
+                for batch_entities in tqdm(pool.imap(spacy_batch_entities, batches), total=len(batches)):
+                    entities += batch_entities
+        else:
+            for batch in tqdm(batches):
+                entities += spacy_batch_entities(batch)
         print()
         
         return entities
 
 class Gate(NamedEntityRecogniser):
-    def __init__(self, key_id, password) -> None:
-        self.key_id = key_id
-        self.password = password
+    def __init__(self, key_id, password, client=None) -> None:
+        # The client (connection pool, rate limit and retries) can be shared with other GATE Cloud services
+        self.client = client if client is not None else ApiClient(key_id, password)
 
-    # Rate limit API calls to GATE
-    @sleep_and_retry
-    @limits(calls=1, period=1)
     def call_gate_api(self, sentence):
         results = []
-        endpoint_url = 'https://cloud-api.gate.ac.uk/process/annie-named-entity-recognizer'
-        headers = {
-            "Content-Type": "text/plain"
-        }
-
-        response = requests.post(endpoint_url,
-                                auth=(self.key_id, self.password),
-                                data = sentence.encode('utf-8'),
-                                headers = headers)
-        results.append(response.text)
+        results.append(self.client.post('annie-named-entity-recognizer', sentence))
 
         return results
 
@@ -63,8 +95,7 @@ class Gate(NamedEntityRecogniser):
         entities = list()
 
         print('Retrieving Named Entities with GATE...')
-        for sentence in tqdm(sentences):
-            raw_data = self.call_gate_api(sentence)[0]
+        for raw_data in self.client.map('annie-named-entity-recognizer', sentences):
             dict_output = json.loads(raw_data)['entities']
             text = json.loads(raw_data)['text']
 
@@ -84,19 +115,34 @@ class Gate(NamedEntityRecogniser):
         return entities
     
 class Flair(NamedEntityRecogniser):
-    def __init__(self):
+    def __init__(self, mini_batch_size=32, bucket_size=1024, num_threads=None):
         self.tagger = SequenceTagger.load('ner')
+        self.mini_batch_size = mini_batch_size
+        # Sentences are predicted in buckets of similar token length so that the mini-batches need little padding
+        self.bucket_size = bucket_size
+        # Cap the number of intra-op threads used by torch, by default to half of the cores so that it doesn't
+        # oversubscribe them when it runs next to the spaCy processes of the ensemble
+        if num_threads is None:
+            num_threads = max(1, multiprocessing.cpu_count() // 2)
+        torch.set_num_threads(num_threads)
     
     def get_entities(self, sentences): 
-        # Load the NER tagger
         entities = list()
+        inputs = [Sentence(sentence) for sentence in sentences]
+        order = sorted(range(len(inputs)), key=lambda idx: len(inputs[idx]))
 
         print('Retrieving Named Entities with Flair...')
-        for sentence in tqdm(sentences):
-            input = Sentence(sentence)
-            self.tagger.predict(input)            
+        start = time.time()
+        for idx in tqdm(range(0, len(order), self.bucket_size)):
+            bucket = [inputs[input_idx] for input_idx in order[idx:idx + self.bucket_size]]
+            self.tagger.predict(bucket, mini_batch_size=self.mini_batch_size)
+        elapsed = time.time() - start
+
+        # Collect the spans in the original sentence order
+        for input in inputs:
             for entity in input.get_spans('ner'):
                 entities.append(entity.text)
+        print(f'{len(inputs) / max(elapsed, 1e-9):.1f} sentences/sec')
         print()
 
-        return entities  
\ No newline at end of file
+        return entities
@@ -0,0 +1,158 @@
+from corenlp_protobuf import Document, parseFromDelimitedString
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from tqdm import tqdm
+import subprocess
+import requests
+import queue
+import json
+import time
+import os
+
+ANNOTATORS = 'tokenize,ssplit,pos,lemma,depparse,natlog,openie'
+
+class OpenIEPool:
+    # Keeps a pool of CoreNLP servers warm and spreads the input shards across them in parallel,
+    # instead of paying JVM startup and model loading for every OpenIE run.
+    # When urls are given, already running servers (or a local stub) are used and nothing is launched.
+
+    # Every worker is a JVM with a heap of the given size, num_workers=2 needs twice the memory of a single OpenIE run
+    def __init__(self, stanford_path=None, num_workers=1, memory='8g', base_port=9000, urls=None,
+                 properties=None, timeout=600) -> None:
+        self.stanford_path = stanford_path
+        self.memory = memory
+        self.timeout = timeout
+        self.processes = []
+        self.started = False
+
+        if urls is None:
+            self.ports = [base_port + idx for idx in range(num_workers)]
+            self.urls = [f'http://localhost:{port}' for port in self.ports]
+        else:
+            self.ports = []
+            self.urls = list(urls)
+
+        # Same settings as the OpenIE command line runs: one sentence per line and drop untokenizable characters.
+        # The annotations come back as protobuf, the JSON output leaves out the confidence of the triples
+        self.properties = {
+            'annotators': ANNOTATORS,
+            'outputFormat': 'serialized',
+            'serializer': 'edu.stanford.nlp.pipeline.ProtobufAnnotationSerializer',
+            'ssplit.eolonly': 'true',
+            'tokenize.options': 'untokenizable=noneDelete'
+        }
+        if properties:
+            self.properties.update(properties)
+
+        self.session = requests.Session()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    # Launch a CoreNLP server per port and wait until all of them have loaded their models
+    def start(self):
+        if self.started:
+            return None
+
+        for port in self.ports:
+            args = ['java', f'-mx{self.memory}', '-cp', self.stanford_path, 'edu.stanford.nlp.pipeline.StanfordCoreNLPServer',
+                    '-port', str(port), '-timeout', str(self.timeout * 1000), '-threads', '1', '-maxCharLength', '-1',
+                    '-preload', ANNOTATORS, '-quiet']
+            self.processes.append(subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT))
+
+        for url in self.urls:
+            self.wait_until_ready(url)
+        self.started = True
+
+        return None
+
+    def wait_until_ready(self, url, poll_interval=1):
+        deadline = time.time() + self.timeout
+
+        while time.time() < deadline:
+            if any(process.poll() is not None for process in self.processes):
+                raise RuntimeError('A CoreNLP worker exited during startup')
+            try:
+                if self.session.get(f'{url}/ready', timeout=poll_interval).status_code == 200:
+                    return None
+            except requests.exceptions.RequestException:
+                pass
+            time.sleep(poll_interval)
+
+        raise TimeoutError(f'CoreNLP worker at {url} did not become ready')
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            process.wait()
+        self.processes = []
+        self.started = False
+
+        return None
+
+    # Send a single document (shard) to a worker and return the parsed protobuf annotation
+    def annotate(self, url, text):
+        response = self.session.post(url, params={'properties': json.dumps(self.properties)},
+                                     data=text.encode('utf-8'), timeout=self.timeout)
+        response.raise_for_status()
+
+        document = Document()
+        parseFromDelimitedString(document, response.content)
+
+        return document
+
+    # Annotate a shard file on the first idle worker and return its triples in the reverb layout
+    def extract_file(self, filename, idle_urls):
+        url = idle_urls.get()
+        try:
+            with open(filename, 'r', encoding='utf-8', newline='') as file:
+                annotation = self.annotate(url, file.read())
+        finally:
+            idle_urls.put(url)
+
+        return to_reverb_rows(filename, annotation)
+
+    # Run OpenIE over all shards in parallel and write the triples to output_path as they stream back
+    def extract(self, filenames, output_path):
+        idle_urls = queue.Queue()
+        for url in self.urls:
+            idle_urls.put(url)
+
+        num_triples = 0
+        with ThreadPoolExecutor(max_workers=len(self.urls)) as executor, open(output_path, 'w', encoding='utf-8') as output:
+            futures = [executor.submit(self.extract_file, filename, idle_urls) for filename in filenames]
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                for row in future.result():
+                    output.write('\t'.join(str(value) for value in row) + '\n')
+                    num_triples += 1
+
+        return num_triples
+
+# Convert the CoreNLP protobuf output to the columns written by OpenIE's reverb format:
+# docid, sentence index, subject, relation, object, subject/relation/object token spans and confidence
+def to_reverb_rows(filename, document):
+    rows = []
+    docid = os.path.basename(filename)
+
+    for sentence in document.sentence:
+        for triple in sentence.openieTriple:
+            rows.append((docid, sentence.sentenceIndex, clean(triple.subject), clean(triple.relation),
+                         clean(triple.object), *token_span(triple.subjectTokens), *token_span(triple.relationTokens),
+                         *token_span(triple.objectTokens), triple.confidence))
+
+    return rows
+
+# (first, last + 1) token index of a triple part, (-1, -1) if it has no tokens (e.g. an implied relation)
+def token_span(tokens):
+    if not tokens:
+        return -1, -1
+
+    indices = [token.tokenIndex for token in tokens]
+    return min(indices), max(indices) + 1
+
+def clean(text):
+    return text.replace('\t', ' ').replace('\n', ' ')
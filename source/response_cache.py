@@ -0,0 +1,82 @@
+from sqlitedict import SqliteDict
+from source.utils import normalise
+import threading
+import time
+import os
+
+class ResponseCache:
+    # On-disk cache of API responses keyed by (service, normalised text), shared by the GATE Cloud services.
+    # Entries expire after `ttl` seconds and the oldest ones are evicted once there are more than `max_entries`.
+
+    def __init__(self, path, ttl=30 * 24 * 60 * 60, max_entries=1000000) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = SqliteDict(path, tablename='responses', autocommit=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.size = len(self.db)
+
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # exact: key on the text as is, for callers that rely on the character offsets of the response
+    def key(self, service, text, exact=False):
+        if exact:
+            return f'{service}:exact\n{text}'
+        return f'{service}\n{normalise(text)}'
+
+    def get(self, service, text, exact=False):
+        key = self.key(service, text, exact)
+        entry = self.db.get(key)
+
+        # Expired entries count as misses and are removed
+        if entry is not None and time.time() - entry[0] > self.ttl:
+            self.delete(key)
+            entry = None
+
+        with self.lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        return entry[1]
+
+    def put(self, service, text, response, exact=False):
+        key = self.key(service, text, exact)
+        with self.lock:
+            if key not in self.db:
+                self.size += 1
+            self.db[key] = (time.time(), response)
+            needs_eviction = self.size > self.max_entries
+
+        if needs_eviction:
+            self.evict()
+
+        return None
+
+    def delete(self, key):
+        with self.lock:
+            if key in self.db:
+                del self.db[key]
+                self.size -= 1
+
+        return None
+
+    # Remove the oldest entries, down to 90% of max_entries so that eviction doesn't run on every insert
+    def evict(self):
+        with self.lock:
+            timestamps = sorted((entry[0], key) for key, entry in self.db.items())
+            for _, key in timestamps[:len(timestamps) - int(self.max_entries * 0.9)]:
+                del self.db[key]
+            self.size = len(self.db)
+
+        return None
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,131 @@
+from nltk.tokenize import sent_tokenize
+import pandas as pd
+import os
+
+from source.utils import silent_remove
+
+class ShardWriter:
+    # Streams records into shard files of a bounded size (rows and/or bytes per shard) with one sentence per line.
+    # A manifest maps every line of every shard back to the record it came from, so the triples extracted
+    # from a line can be traced back to their source document without any sentinel sentences.
+
+    def __init__(self, directory, prefix, rows_per_shard=1000, bytes_per_shard=None, filelist_name='filelist.txt') -> None:
+        self.directory = directory
+        self.prefix = prefix
+        self.filelist_name = filelist_name
+        self.rows_per_shard = rows_per_shard
+        self.bytes_per_shard = bytes_per_shard
+
+        self.filenames = []
+        self.manifest = []
+        self.file = None
+        self.rows_in_shard = 0
+        self.bytes_in_shard = 0
+        self.line_idx = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Write a single record, split into sentences; records are never split across shards
+    def write(self, record_id, text):
+        sentences = split_sentences(text)
+        if not sentences:
+            return None
+
+        if self.file is None or self.is_full():
+            self.open_shard()
+
+        for sentence_idx, sentence in enumerate(sentences):
+            line = f'{sentence}\n'
+            self.file.write(line)
+            self.manifest.append((os.path.basename(self.filenames[-1]), self.line_idx, record_id, sentence_idx))
+            self.bytes_in_shard += len(line.encode('utf-8'))
+            self.line_idx += 1
+
+        self.rows_in_shard += 1
+
+        return None
+
+    def is_full(self):
+        if self.rows_per_shard is not None and self.rows_in_shard >= self.rows_per_shard:
+            return True
+        if self.bytes_per_shard is not None and self.bytes_in_shard >= self.bytes_per_shard:
+            return True
+
+        return False
+
+    def open_shard(self):
+        if self.file is not None:
+            self.file.close()
+
+        filename = f'{self.directory}/{self.prefix}_{len(self.filenames)}.txt'
+        self.file = open(filename, 'w', encoding='utf-8', newline='')
+        self.filenames.append(filename)
+        self.rows_in_shard = 0
+        self.bytes_in_shard = 0
+        self.line_idx = 0
+
+        return None
+
+    # Close the last shard and write the filelist (for the CoreNLP command line) and the manifest
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+        if self.filelist_name is not None:
+            filelist_path = f'{self.directory}/{self.filelist_name}'
+            silent_remove(filelist_path)
+            with open(filelist_path, 'w') as file:
+                for filename in self.filenames:
+                    file.write(f'{filename}\n')
+
+        manifest_df = pd.DataFrame(self.manifest, columns=['Shard', 'Line', 'Document', 'Sentence'])
+        manifest_df.to_csv(manifest_path(self.directory, self.prefix), index=False)
+
+        return self.filenames
+
+def manifest_path(directory, prefix):
+    return f'{directory}/{prefix}_manifest.csv'
+
+def load_manifest(directory, prefix):
+    return pd.read_csv(manifest_path(directory, prefix))
+
+# Rebuild the text of every record (record id -> text) from the shards and their manifest
+def load_documents(directory, prefix):
+    documents = dict()
+
+    for document, line in load_lines(directory, prefix):
+        documents[document] = f'{documents[document]} {line}' if document in documents else line
+
+    return documents
+
+# Yield (record id, sentence) for every shard line, optionally only for the given record ids
+def load_lines(directory, prefix, documents=None):
+    manifest = load_manifest(directory, prefix)
+    if documents is not None:
+        manifest = manifest[manifest['Document'].isin(documents)]
+
+    for shard, shard_manifest in manifest.groupby('Shard', sort=False):
+        # newline='' so that only the '\n' written after every sentence ends a line
+        with open(f'{directory}/{shard}', 'r', encoding='utf-8', newline='') as file:
+            lines = file.read().split('\n')
+        for row in shard_manifest.itertuples(index=False):
+            yield row.Document, lines[row.Line]
+
+# Split a record into sentences, one per shard line; CoreNLP is run with ssplit.eolonly so lines map 1:1 to sentences.
+# All whitespace within a sentence is collapsed to single spaces, as any line break ('\r', '\x85', '\u2028', ...)
+# left in it would be read back as the end of a line and shift every later line.
+def split_sentences(text):
+    sentences = [' '.join(sentence.split()) for sentence in sent_tokenize(text.strip())]
+    # Sentences without any word characters could be dropped by the tokenizer and would shift the line numbers
+    return [sentence for sentence in sentences if any(char.isalnum() for char in sentence)]
+
+# Attach the source document and sentence to every triple using the shard (docid) and line (sentence index)
+def attach_documents(triples, manifest):
+    triples['Shard'] = triples['Shard'].map(os.path.basename)
+    triples = triples.merge(manifest, how='inner', on=['Shard', 'Line'])
+    return triples.sort_values(['Document', 'Sentence'], kind='mergesort').reset_index(drop=True)
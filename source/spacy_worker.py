@@ -0,0 +1,34 @@
+# spaCy NER for the worker processes of source.ner.Spacy. Kept apart from source.ner, which imports flair and torch,
+# so that a spawned worker only has to import spaCy when it unpickles spacy_batch_entities.
+import subprocess
+import spacy
+import sys
+
+# spaCy models loaded in the current process, by name and disabled components
+spacy_models = dict()
+
+def load_spacy_model(model, disable):
+    key = (model, tuple(disable))
+
+    if key not in spacy_models:
+        try:
+            spacy_models[key] = spacy.load(model, disable=disable)
+        except OSError:
+            # Download the model
+            subprocess.check_call([sys.executable, "-m", "spacy", "download", model])
+            spacy_models[key] = spacy.load(model, disable=disable)
+
+    return spacy_models[key]
+
+# Module level so that it can be sent to worker processes
+def spacy_batch_entities(batch):
+    model, disable, ignored_labels, sentences = batch
+    nlp = load_spacy_model(model, disable)
+    entities = list()
+
+    for doc in nlp.pipe(sentences, batch_size=len(sentences)):
+        for ent in doc.ents:
+            if ent.label_ not in ignored_labels:
+                entities.append(str(ent))
+
+    return entities
@@ -0,0 +1,83 @@
+from gensim.topic_coherence.text_analysis import ParallelWordOccurrenceAccumulator, WordOccurrenceAccumulator
+from gensim.models.coherencemodel import COHERENCE_MEASURES, SLIDING_WINDOW_SIZES
+from gensim import matutils
+import pickle
+
+class CoherenceEvaluator:
+    # Scores any number of topic models against one (dictionary, texts) pair. The sliding-window word
+    # co-occurrence statistics are only accumulated for the top words of the topics being scored (as CoherenceModel
+    # does), but once for all of them: score_topic_sets accumulates over the union of the top words of many models,
+    # and later topics only trigger a new pass when they contain words that aren't covered yet.
+
+    def __init__(self, dictionary, texts, coherence='c_v', window_size=None, topn=20, processes=1, relevant_ids=None) -> None:
+        if coherence not in ('c_v', 'c_uci', 'c_npmi'):
+            raise ValueError(f'Unsupported sliding window coherence measure: {coherence}')
+
+        self.dictionary = dictionary
+        # Re-iterable, the texts are streamed again whenever the relevant words grow
+        self.texts = texts
+        self.coherence = coherence
+        self.window_size = window_size or SLIDING_WINDOW_SIZES[coherence]
+        self.topn = topn
+        self.processes = processes
+
+        self.relevant_ids = set()
+        self.accumulator = None
+        if relevant_ids is not None:
+            self.add_relevant_ids(relevant_ids)
+
+    # Make sure the co-occurrences of these word ids are counted, accumulating again over the union if needed
+    def add_relevant_ids(self, ids):
+        ids = set(ids)
+        if self.accumulator is not None and ids <= self.relevant_ids:
+            return None
+
+        self.relevant_ids |= ids
+        if self.processes > 1:
+            accumulator = ParallelWordOccurrenceAccumulator(self.processes, self.relevant_ids, self.dictionary)
+        else:
+            accumulator = WordOccurrenceAccumulator(self.relevant_ids, self.dictionary)
+        self.accumulator = accumulator.accumulate(self.texts, self.window_size)
+
+        return None
+
+    # Segmentation, confirmation and aggregation functions of the measure
+    @property
+    def measure(self):
+        return COHERENCE_MEASURES[self.coherence]
+
+    # Top word ids of every topic of a trained model
+    def top_topics(self, lda_model):
+        return [matutils.argsort(topic, topn=self.topn, reverse=True) for topic in lda_model.get_topics()]
+
+    # Coherence of a trained topic model, based on its topn words per topic
+    def score_model(self, lda_model):
+        return self.score_topics(self.top_topics(lda_model))
+
+    # Coherence of topics given as lists of word ids
+    def score_topics(self, topics):
+        return self.score_topic_sets([topics])[0]
+
+    # Coherence of several models' topics, with a single accumulation over all their top words
+    def score_topic_sets(self, topic_sets):
+        self.add_relevant_ids(word_id for topics in topic_sets for topic in topics for word_id in topic)
+        return [self.measure.aggr(self.score_per_topic(topics)) for topics in topic_sets]
+
+    def score_per_topic(self, topics):
+        segmented_topics = self.measure.seg(topics)
+
+        if self.coherence == 'c_v':
+            kwargs = dict(topics=topics, measure='nlr', gamma=1)
+        else:
+            kwargs = dict(normalize=(self.coherence == 'c_npmi'))
+
+        return self.measure.conf(segmented_topics, self.accumulator, **kwargs)
+
+    def save(self, path):
+        with open(path, 'wb') as file:
+            pickle.dump(self, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as file:
+            return pickle.load(file)
@@ -1,125 +1,114 @@
-from gensim.corpora import Dictionary
-from gensim.models import LdaMulticore, CoherenceModel, LdaModel
+from gensim.corpora import Dictionary, MmCorpus
+from gensim.models import LdaMulticore, LdaModel
+from source.topic_modelling.coherence import CoherenceEvaluator
 from gensim.utils import simple_preprocess
 from gensim.parsing.preprocessing import STOPWORDS
 import nltk
 from wordcloud import WordCloud
 import matplotlib.pyplot as plt
+import os
+
+# Token views produced for every document, each one has its own dictionary and corpus
+VIEWS = ['bow', 'triple', 'subject', 'verb', 'object']
+VIEW_NAMES = {'bow': 'BOW', 'triple': 'Triples', 'subject': 'Subject', 'verb': 'Verb', 'object': 'Object'}
 
 class LDA:
-    def __init__(self, triples, subjects, objects, verbs):
+    # documents: iterable of documents, each a list of (subject, verb, object) triples. The documents are streamed
+    # once; the tokenised views and the corpora are written to output_dir so memory stays bounded.
+    def __init__(self, documents, output_dir):
         nltk.download('wordnet')
-        self.stopwords = set(STOPWORDS)
-        self.stopwords.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
+        self.stopwords = lda_stopwords()
+        self.coherence_evaluators = dict()
+        os.makedirs(output_dir, exist_ok=True)
 
         # Prepare dictionaries and corpuses for all LDA models
-        self.bow_data, self.triples, self.subjects, self.verbs, self.objects = self.preprocess_data(triples, subjects, verbs, objects)
-
-        # Plot a word cloud based on self.triples
-        flattened_triples = [item for sublist in self.triples for item in sublist]
-        joined_triples = [triple.replace(' ', 'v') for triple in flattened_triples]
-        print(joined_triples)
-        WordCloud(width=1200, height=600).generate(' '.join(joined_triples)).to_file('wordcloud.png')
-
-        # Create dictionary and corpus for all models
-        self.dictionary_triple = Dictionary(self.triples)
-        self.corpus_triple = [self.dictionary_triple.doc2bow(doc) for doc in self.triples]
-
-        self.dictionary_bow = Dictionary(self.bow_data)
-        self.corpus_bow = [self.dictionary_bow.doc2bow(text) for text in self.bow_data]
-
-        self.dictionary_subject = Dictionary(self.subjects)
-        self.dictionary_verb = Dictionary(self.verbs)
-        self.dictionary_object = Dictionary(self.objects)
-        self.corpus_subject = [self.dictionary_subject.doc2bow(text) for text in self.subjects]
-        self.corpus_verb = [self.dictionary_verb.doc2bow(text) for text in self.verbs]
-        self.corpus_object = [self.dictionary_object.doc2bow(text) for text in self.objects]
-
-    def preprocess_data(self, docs_triples, docs_subjects, docs_verbs, docs_objects):
-        bow_data = list()
-        triples_data = list()
-        subjects_data = list()
-        verbs_data = list()
-        objects_data = list()
-
-        # Preprocess text data for every type of model
-        for doc_tuple in zip(docs_triples, docs_subjects, docs_verbs, docs_objects):
-            tokenised_bow = list()
-            tokenised_triples = list()
-            tokenised_subject = list()
-            tokenised_verb = list()
-            tokenised_object = list()
-
-            for triple in doc_tuple[0]:
-                triple = triple.replace(' is ', ' ')
-                tokenised = simple_preprocess(triple)
-                if len(tokenised) < 3:
-                    continue
-                tokenised_bow += tokenised
-                tokenised_triples.append(' '.join(tokenised))
-
-            for subject in doc_tuple[1]:
-                tokenised_subject += simple_preprocess(subject)
-
-            for verb in doc_tuple[2]:
-                tokenised_verb += simple_preprocess(verb)
-
-            for obj in doc_tuple[3]:
-                tokenised_object += simple_preprocess(obj)
-
-            bow_data.append(list(filter(lambda x: x not in self.stopwords, tokenised_bow)))
-            triples_data.append(tokenised_triples)
-            subjects_data.append(tokenised_subject)
-            verbs_data.append(tokenised_verb)
-            objects_data.append(tokenised_object)
-
-            # Remove empty lists from the data
-            bow_data = list(filter(None, bow_data))
-            triples_data = list(filter(None, triples_data))
-            subjects_data = list(filter(None, subjects_data))
-            verbs_data = list(filter(None, verbs_data))
-            objects_data = list(filter(None, objects_data))
-
-        return bow_data, triples_data, subjects_data, verbs_data, objects_data
+        texts, dictionaries = self.preprocess_data(documents, output_dir)
+        self.bow_data, self.triples, self.subjects, self.verbs, self.objects = [texts[view] for view in VIEWS]
+        self.dictionary_bow, self.dictionary_triple, self.dictionary_subject, self.dictionary_verb, self.dictionary_object = \
+            [dictionaries[view] for view in VIEWS]
+
+        # Write every corpus to disk in a single streaming pass over its tokenised documents
+        corpora = dict()
+        for view in VIEWS:
+            corpus_path = f'{output_dir}/corpus_{view}.mm'
+            MmCorpus.serialize(corpus_path, (dictionaries[view].doc2bow(text) for text in texts[view]))
+            corpora[view] = MmCorpus(corpus_path)
+        self.corpus_bow, self.corpus_triple, self.corpus_subject, self.corpus_verb, self.corpus_object = \
+            [corpora[view] for view in VIEWS]
+        # View -> (corpus, dictionary, tokenised texts)
+        self.views = {view: (corpora[view], dictionaries[view], texts[view]) for view in VIEWS}
+
+        # Plot a word cloud based on the triple frequencies
+        frequencies = {self.dictionary_triple[token_id].replace(' ', 'v'): count
+                       for token_id, count in self.dictionary_triple.cfs.items()}
+        if frequencies:
+            WordCloud(width=1200, height=600).generate_from_frequencies(frequencies).to_file('wordcloud.png')
+
+    # Stream the documents into one file per view (one document per line) while growing the dictionaries
+    def preprocess_data(self, documents, output_dir):
+        texts = {view: TokenisedTexts(f'{output_dir}/texts_{view}.txt') for view in VIEWS}
+        dictionaries = {view: Dictionary() for view in VIEWS}
+        files = {view: open(texts[view].path, 'w', encoding='utf-8') for view in VIEWS}
+
+        try:
+            for views in tokenise_documents(documents, self.stopwords):
+                for view, tokens in views.items():
+                    # Documents that are empty for a view are left out of its corpus
+                    if tokens:
+                        files[view].write('\t'.join(tokens) + '\n')
+                        dictionaries[view].doc2bow(tokens, allow_update=True)
+        finally:
+            for file in files.values():
+                file.close()
+
+        return texts, dictionaries
 
     # Perform LDA using the BOW-based model
     def get_topics_bow(self, num_topics, alpha='auto', passes=1, workers=2):
-        lda_model = LdaModel(self.corpus_bow, num_topics=num_topics, id2word=self.dictionary_bow, passes=passes, alpha=alpha)
-        coherence = self.get_coherence_score(lda_model, self.dictionary_bow, self.bow_data, processes=workers)
-        self.print_topics(lda_model, f'BOW - Topics = {num_topics}, Alpha = {alpha}, Passes = {passes}', coherence)
+        coherence, _ = self.get_topics_grid('bow', [(num_topics, passes)], alpha, workers)[0]
 
         return coherence
 
     # Perform LDA using the Triple-based model
     def get_topics_triple(self, num_topics, alpha='auto', passes=1, workers=2):
-        lda_model = LdaModel(self.corpus_triple, num_topics=num_topics, id2word=self.dictionary_triple, passes=passes, alpha=alpha)
-        coherence = self.get_coherence_score(lda_model, self.dictionary_triple, self.triples, processes=workers)
-        self.print_topics(lda_model, f'Triples - Topics = {num_topics}, Alpha = {alpha}, Passes = {passes}', coherence)
-
-        return coherence, lda_model
+        return self.get_topics_grid('triple', [(num_topics, passes)], alpha, workers)[0]
 
     # Perform LDA using SVO-based model
     def get_topics_svo(self, num_topics, alpha='auto', passes=1, workers=2):
-        lda_model = LdaModel(self.corpus_subject, num_topics=num_topics, id2word=self.dictionary_subject, passes=passes, alpha=alpha)
-        coherence_s = self.get_coherence_score(lda_model, self.dictionary_subject, self.subjects)
-        self.print_topics(lda_model, f'Subject - Topics = {num_topics}, Alpha = {alpha}, Passes = {passes}', coherence_s)
-
-        lda_model = LdaModel(self.corpus_verb, num_topics=num_topics, id2word=self.dictionary_verb, passes=passes, alpha=alpha)
-        coherence_v = self.get_coherence_score(lda_model, self.dictionary_verb, self.verbs)
-        self.print_topics(lda_model, f'Verb - Topics = {num_topics}, Alpha = {alpha}, Passes = {passes}', coherence_v)
-
-        lda_model = LdaModel(self.corpus_object, num_topics=num_topics, id2word=self.dictionary_object, passes=passes, alpha=alpha)
-        coherence_o = self.get_coherence_score(lda_model, self.dictionary_object, self.objects, processes=workers)
-        self.print_topics(lda_model, f'Object - Topics = {num_topics}, Alpha = {alpha}, Passes = {passes}', coherence_o)
-
-        return (coherence_s + coherence_v + coherence_o) / 3.0
-
-    # Calculate and print coherence (possible coherence metrics: c_v, u_mass, c_uci)
+        coherences = [self.get_topics_grid(view, [(num_topics, passes)], alpha, workers)[0][0]
+                      for view in ('subject', 'verb', 'object')]
+
+        return sum(coherences) / 3.0
+
+    # Perform LDA on a view for every (num_topics, passes) grid point and return (coherence, model) per grid point.
+    # All the models are scored together, so the texts are passed over once for the top words of all of them.
+    # Calling get_topics_bow/triple/svo once per grid point instead passes over the texts again for every model
+    # that brings new top words, which is about as slow as scoring each model on its own.
+    def get_topics_grid(self, view, grid, alpha='auto', workers=2):
+        corpus, dictionary, texts = self.views[view]
+        models = [LdaModel(corpus, num_topics=num_topics, id2word=dictionary, passes=passes, alpha=alpha)
+                  for num_topics, passes in grid]
+
+        evaluator = self.coherence_evaluator(dictionary, texts, processes=workers)
+        coherences = evaluator.score_topic_sets([evaluator.top_topics(lda_model) for lda_model in models])
+        for (num_topics, passes), lda_model, coherence in zip(grid, models, coherences):
+            self.print_topics(lda_model, f'{VIEW_NAMES[view]} - Topics = {num_topics}, Alpha = {alpha}, Passes = {passes}',
+                              coherence)
+
+        return list(zip(coherences, models))
+
+    # Calculate coherence (possible coherence metrics: c_v, c_uci, c_npmi) of a single model. The co-occurrence
+    # statistics are kept per dictionary and metric and only accumulated again when the model brings new top words;
+    # use get_topics_grid to score many models with one pass.
     def get_coherence_score(self, lda_model, dictionary, data, coherence_metric='c_v', processes=2):
-        coherence_model_lda = CoherenceModel(model=lda_model, texts=data, dictionary=dictionary, coherence=coherence_metric, processes=processes) 
-        coherence_lda = coherence_model_lda.get_coherence()
+        return self.coherence_evaluator(dictionary, data, coherence_metric, processes).score_model(lda_model)
+
+    def coherence_evaluator(self, dictionary, data, coherence_metric='c_v', processes=2):
+        key = (id(dictionary), coherence_metric)
+        if key not in self.coherence_evaluators:
+            self.coherence_evaluators[key] = CoherenceEvaluator(dictionary, data, coherence=coherence_metric, processes=processes)
 
-        return coherence_lda
+        return self.coherence_evaluators[key]
 
     def print_topics(self, lda_model, name, coherence_score):
         # Write topics to a file in source/output_files folder
@@ -133,3 +122,44 @@ class LDA:
             f.write(f'Coherence Score: {coherence_score}')
             f.write('\n\n\n')
         print('Topics written to source/output_files/lda_analysis.txt')
+
+# Tokenise every document once and yield its BoW, triple, subject, verb and object token views together
+def tokenise_documents(documents, stopwords):
+    for doc in documents:
+        tokenised_bow = list()
+        tokenised_triples = list()
+        tokenised_subject = list()
+        tokenised_verb = list()
+        tokenised_object = list()
+
+        for subject, verb, obj in doc:
+            triple = f'{subject} {verb} {obj}'.replace(' is ', ' ')
+            tokenised = simple_preprocess(triple)
+            if len(tokenised) >= 3:
+                tokenised_bow += tokenised
+                tokenised_triples.append(' '.join(tokenised))
+
+            tokenised_subject += simple_preprocess(subject)
+            tokenised_verb += simple_preprocess(verb)
+            tokenised_object += simple_preprocess(obj)
+
+        tokenised_bow = [token for token in tokenised_bow if token not in stopwords]
+
+        yield {'bow': tokenised_bow, 'triple': tokenised_triples, 'subject': tokenised_subject,
+               'verb': tokenised_verb, 'object': tokenised_object}
+
+def lda_stopwords():
+    stopwords = set(STOPWORDS)
+    stopwords.update(['.', ',', '"', "'", '?', '!', ':', ';', '(', ')', '[', ']', '{', '}'])
+
+    return stopwords
+
+class TokenisedTexts:
+    # Re-iterable view of tokenised documents stored on disk, one tab separated document per line
+    def __init__(self, path):
+        self.path = path
+
+    def __iter__(self):
+        with open(self.path, 'r', encoding='utf-8') as file:
+            for line in file:
+                yield line.rstrip('\n').split('\t')
@@ -0,0 +1,75 @@
+from source.topic_modelling.lda import lda_stopwords, tokenise_documents
+from gensim.corpora import Dictionary
+from gensim.models import LdaModel
+from collections import Counter
+import numpy as np
+
+class OnlineLDA:
+    # Keeps a saved LDA model current with online updates on the newly arriving documents only.
+    # The vocabulary is extended with the frequent new tokens and the topic-word state is grown to match.
+    def __init__(self, model_path, dictionary_path, view='triple'):
+        self.lda_model = LdaModel.load(model_path)
+        self.dictionary = Dictionary.load(dictionary_path)
+        self.view = view
+        self.stopwords = lda_stopwords()
+
+    # documents: iterable of documents, each a list of (subject, verb, object) triples
+    def tokenise(self, documents):
+        return [views[self.view] for views in tokenise_documents(documents, self.stopwords)]
+
+    # Add the new tokens seen at least min_count times (at most max_new_terms of them, most frequent first);
+    # existing token ids never change so the model stays valid
+    def extend_vocabulary(self, texts, min_count=2, max_new_terms=1000):
+        counts = Counter(token for text in texts for token in text if token not in self.dictionary.token2id)
+        new_tokens = set(token for token, count in counts.most_common(max_new_terms) if count >= min_count)
+
+        self.dictionary.add_documents([[token for token in text if token in self.dictionary.token2id or token in new_tokens]
+                                       for text in texts])
+        self.grow_model()
+
+        return len(new_tokens)
+
+    # Pad the topic-word statistics and the eta prior with the new terms
+    def grow_model(self):
+        lda_model = self.lda_model
+        num_new = len(self.dictionary) - lda_model.num_terms
+        if num_new <= 0:
+            return None
+
+        eta = lda_model.eta
+        padding = np.full(eta.shape[:-1] + (num_new,), eta.mean(), dtype=eta.dtype)
+        lda_model.eta = np.concatenate([eta, padding], axis=-1)
+        lda_model.state.eta = lda_model.eta.astype(lda_model.state.eta.dtype, copy=False)
+
+        sstats = lda_model.state.sstats
+        lda_model.state.sstats = np.concatenate([sstats, np.zeros((sstats.shape[0], num_new), dtype=sstats.dtype)], axis=1)
+
+        lda_model.num_terms = len(self.dictionary)
+        lda_model.id2word = self.dictionary
+        lda_model.sync_state()
+
+        return None
+
+    # Online update with the new documents' BoW vectors only
+    def update(self, texts, **kwargs):
+        corpus = [self.dictionary.doc2bow(text) for text in texts if text]
+        if corpus:
+            self.lda_model.update(corpus, **kwargs)
+
+        return len(corpus)
+
+    # Most likely topic and its probability for every text, inferred in one batch
+    def assign_topics(self, texts):
+        corpus = [self.dictionary.doc2bow(text) for text in texts]
+        if not corpus:
+            return np.empty(0, dtype=int), np.empty(0)
+
+        gamma, _ = self.lda_model.inference(corpus)
+        distributions = gamma / gamma.sum(axis=1, keepdims=True)
+        topics = distributions.argmax(axis=1)
+
+        return topics, distributions[np.arange(len(topics)), topics]
+
+    def save(self, model_path, dictionary_path):
+        self.lda_model.save(model_path)
+        self.dictionary.save(dictionary_path)
@@ -0,0 +1,68 @@
+from source.topic_modelling.coherence import CoherenceEvaluator
+from gensim.models import LdaModel, LdaMulticore
+from gensim.corpora import Dictionary, MmCorpus
+import multiprocessing
+import pandas as pd
+import os
+
+class LDASweep:
+    # Hyperparameter sweep over a grid of LDA settings. The corpus and dictionary are serialised to disk once
+    # (Matrix Market corpus, read through a memory map by every worker) and the grid points are trained in a
+    # process pool, or one after the other with LdaMulticore. The models are scored together afterwards, so the
+    # coherence statistics are accumulated once over the top words of all of them. All results end up in one table.
+
+    def __init__(self, corpus, dictionary, texts, output_dir, name, processes=None, coherence='c_v') -> None:
+        self.output_dir = output_dir
+        self.name = name
+        self.processes = processes or multiprocessing.cpu_count()
+
+        os.makedirs(output_dir, exist_ok=True)
+        self.corpus_path = f'{output_dir}/{name}_corpus.mm'
+        self.dictionary_path = f'{output_dir}/{name}_dictionary.dict'
+        MmCorpus.serialize(self.corpus_path, corpus)
+        dictionary.save(self.dictionary_path)
+        self.evaluator = CoherenceEvaluator(dictionary, texts, coherence=coherence, processes=self.processes)
+
+    # Grid points are dicts of LdaModel keyword arguments, e.g. {'num_topics': 10, 'passes': 1, 'alpha': 'auto'}
+    def run(self, grid, multicore=False):
+        tasks = [(self.output_dir, self.name, params) for params in grid]
+
+        if multicore:
+            # A single model at a time, trained with all cores (LdaMulticore doesn't support alpha='auto')
+            init_worker(self.corpus_path, self.dictionary_path)
+            rows = [train_grid_point(task, multicore_workers=self.processes) for task in tasks]
+        else:
+            with multiprocessing.Pool(min(self.processes, len(tasks)), initializer=init_worker,
+                                      initargs=(self.corpus_path, self.dictionary_path)) as pool:
+                rows = pool.map(train_grid_point, tasks)
+
+        # Only the top words of every topic are kept in memory, not the models themselves
+        topic_sets = [self.evaluator.top_topics(LdaModel.load(row['model_path'])) for row in rows]
+        for row, coherence in zip(rows, self.evaluator.score_topic_sets(topic_sets)):
+            row['coherence'] = coherence
+
+        return pd.DataFrame(rows).sort_values('coherence', ascending=False).reset_index(drop=True)
+
+# Corpus and dictionary loaded once per worker process
+worker_data = dict()
+
+def init_worker(corpus_path, dictionary_path):
+    worker_data['corpus'] = MmCorpus(corpus_path)
+    worker_data['dictionary'] = Dictionary.load(dictionary_path)
+
+# Train a single grid point, the model is saved to disk and only its path is sent back
+def train_grid_point(task, multicore_workers=None):
+    output_dir, name, params = task
+    params = dict({'alpha': 'auto', 'passes': 1}, **params)
+
+    if multicore_workers is not None:
+        if params['alpha'] == 'auto':
+            params['alpha'] = 'symmetric'
+        lda_model = LdaMulticore(worker_data['corpus'], id2word=worker_data['dictionary'], workers=multicore_workers, **params)
+    else:
+        lda_model = LdaModel(worker_data['corpus'], id2word=worker_data['dictionary'], **params)
+
+    model_path = f"{output_dir}/{name}_lda_" + '_'.join(f'{key}-{value}' for key, value in sorted(params.items()))
+    lda_model.save(model_path)
+
+    return dict(params, model_path=model_path)
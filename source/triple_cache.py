@@ -0,0 +1,51 @@
+from sqlitedict import SqliteDict
+from source.utils import normalise
+import hashlib
+import json
+import os
+
+# Bumped whenever the way triples are extracted or read changes, so entries written the old way are never used
+# (2: the OpenIE output is read as UTF-8 instead of ISO-8859-1, 3: real triple confidences instead of 1.0)
+FORMAT_VERSION = 3
+
+class TripleCache:
+    # Persistent, content-addressed cache of OpenIE triples. Records are keyed by a hash of their normalised
+    # text and of the extractor settings, so only new or changed records (or a change of settings) need OpenIE again.
+
+    def __init__(self, path, settings) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.db = SqliteDict(path, tablename='triples', autocommit=False)
+        self.settings = json.dumps(settings, sort_keys=True)
+
+    def key(self, text):
+        content = f'{FORMAT_VERSION}\n{self.settings}\n{normalise(text)}'
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        return key in self.db
+
+    # Cached triples of a record as (sentence, confidence, subject, verb, object) tuples
+    def get(self, key):
+        return self.db[key]
+
+    # Store the triples extracted for the new records (record id -> key); records without any triples are cached as empty
+    def update(self, triples, keys):
+        extracted = {record_id: list() for record_id in keys}
+        for row in triples.itertuples(index=False):
+            extracted[row.Document].append((row.Sentence, row.Confidence, row.Subject, row.Verb, row.Object))
+
+        for record_id, record_triples in extracted.items():
+            self.db[keys[record_id]] = record_triples
+        self.db.commit()
+
+        return None
+
+    # Stream the triple table rows for all records in document order from the cache, document_keys holds the
+    # content-based id of every record
+    def collect(self, keys, document_keys):
+        for record_id, key in keys.items():
+            for sentence, confidence, subject, verb, object in self.get(key):
+                yield confidence, subject, verb, object, record_id, sentence, document_keys[record_id]
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,85 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pandas as pd
+import os
+
+COLUMNS = ['Confidence', 'Subject', 'Verb', 'Object', 'Document', 'Sentence', 'DocumentKey']
+
+# Strings are dictionary encoded since subjects, verbs and objects repeat heavily across the triples
+SCHEMA = pa.schema([
+    ('Document', pa.int64()),
+    ('Sentence', pa.int32()),
+    ('Confidence', pa.float32()),
+    ('Subject', pa.dictionary(pa.int32(), pa.string())),
+    ('Verb', pa.dictionary(pa.int32(), pa.string())),
+    ('Object', pa.dictionary(pa.int32(), pa.string())),
+    # Content-based id of the document (see document_key), the row position in Document changes with the source data
+    ('DocumentKey', pa.dictionary(pa.int32(), pa.string())),
+])
+
+class TripleStoreWriter:
+    # Writes triples to a Parquet file in row groups as they are produced, instead of holding the whole table in memory.
+    # Rows with an empty subject, verb or object are dropped once here, so readers never need to filter them.
+
+    def __init__(self, path, row_group_size=65536) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.row_group_size = row_group_size
+        self.writer = pq.ParquetWriter(path, SCHEMA, use_dictionary=True, compression='snappy')
+        self.buffer = []
+        self.num_rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    # Write (confidence, subject, verb, object, document, sentence, document key) rows
+    def write(self, rows):
+        for row in rows:
+            self.buffer.append(row)
+            if len(self.buffer) >= self.row_group_size:
+                self.flush()
+
+        return None
+
+    def flush(self):
+        if not self.buffer:
+            return None
+
+        data = pd.DataFrame(self.buffer, columns=COLUMNS)
+        self.buffer = []
+
+        strings = data[['Subject', 'Verb', 'Object']]
+        data = data[(strings.notnull() & (strings != '')).all(axis=1)]
+        if data.empty:
+            return None
+
+        self.writer.write_table(pa.Table.from_pandas(data[SCHEMA.names], schema=SCHEMA, preserve_index=False),
+                                row_group_size=self.row_group_size)
+        self.num_rows += len(data)
+
+        return None
+
+    def close(self):
+        if self.writer is not None:
+            self.flush()
+            self.writer.close()
+            self.writer = None
+
+# Load the triples of a store, the filters are pushed down to the row groups so only the matching ones are decoded.
+# documents is an inclusive (first, last) range of document ids; strings are returned as pandas categoricals.
+def read_triples(path, min_confidence=None, documents=None, columns=None):
+    filters = []
+    if min_confidence is not None:
+        filters.append(('Confidence', '>=', min_confidence))
+    if documents is not None:
+        filters += [('Document', '>=', documents[0]), ('Document', '<=', documents[1])]
+
+    table = pq.read_table(path, columns=columns or COLUMNS, filters=filters or None)
+
+    return table.to_pandas()
+
+def store_path(working_dir, output_name):
+    return f'{working_dir}/source/output_files/{output_name}.parquet'
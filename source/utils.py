@@ -1,10 +1,15 @@
 from enum import Enum
+import unicodedata
+import hashlib
 import os, errno
 
 class Mode(Enum):
     LDA = 1
     CONSTRUCTION = 2
     DISAMBIGUATION = 3
+    LDA_UPDATE = 4
+    SERVE = 5
+    GRAPH_UPDATE = 6
 
 class DatasetName(Enum):
     UKRAINE = 1
@@ -17,6 +22,14 @@ def silent_remove(filename):
         if e.errno != errno.ENOENT:
             raise
 
+# Normalise text used as a cache key, so that whitespace and unicode representation changes don't cause misses
+def normalise(text):
+    return ' '.join(unicodedata.normalize('NFKC', text).split())
+
+# Content-based id of a record, stays the same whatever position the record has in the source data
+def document_key(text):
+    return hashlib.sha256(normalise(text).encode('utf-8')).hexdigest()
+
 def prepare_data(dataset):
     print(f'Preparing data...')
     # Retrieve semantic triples using OpenIE
@@ -1,30 +1,75 @@
+from source.api_client import ApiClient
+import bisect
 import ast
-import requests
-from ratelimit import limits, sleep_and_retry
 
 class Yodie:
-    def __init__(self, key_id, password) -> None:
-        self.key_id = key_id
-        self.password = password
-        
-    # Rate limit API calls to GATE
-    @sleep_and_retry
-    @limits(calls=1, period=1)
+    def __init__(self, key_id, password, client=None) -> None:
+        # The client (connection pool, rate limit and retries) can be shared with other GATE Cloud services
+        self.client = client if client is not None else ApiClient(key_id, password)
+
     def call(self, text):
-        endpoint_url = 'https://cloud-api.gate.ac.uk/process/yodie-en'
-        headers = {
-            "Content-Type": "text/plain"
-        }
+        response = self.client.post('yodie-en', text)
+
+        return self.process_output(ast.literal_eval(response))
+
+    # Link many texts concurrently, within the rate limit of the client
+    def call_many(self, texts):
+        responses = self.client.map('yodie-en', texts)
+
+        return [self.process_output(ast.literal_eval(response)) for response in responses]
+
+    # Link many entities with few requests: entities are packed into documents of up to max_chars characters,
+    # and every returned mention is mapped back to its source entity by its character offsets
+    def call_batch(self, entities, max_chars=5000, separator='\n\n'):
+        entities = list(entities)
+        batches = []
+        batch = []
+        length = 0
+
+        for entity in entities:
+            if batch and length + len(separator) + len(entity) > max_chars:
+                batches.append(batch)
+                batch = []
+                length = 0
+            length += len(entity) + (len(separator) if batch else 0)
+            batch.append(entity)
+        if batch:
+            batches.append(batch)
+
+        # The offsets depend on the exact document (separators included), so cached responses are only reused for
+        # the very same batch and never for one that merely normalises to the same text
+        documents = [separator.join(batch) for batch in batches]
+        responses = self.client.map('yodie-en', documents, exact_cache_key=True)
+
+        ne_links = {entity: [] for entity in entities}
+        unbatched = []
+        for batch, document, response in zip(batches, documents, responses):
+            yodie_output = ast.literal_eval(response)
 
-        response = requests.post(endpoint_url,
-                                auth=(self.key_id, self.password),
-                                data = text.encode('utf-8'),
-                                headers = headers)
+            # The mentions can only be mapped back if the service annotated the document as it was sent,
+            # otherwise the entities of the batch are linked one by one
+            if yodie_output.get('text', document) != document:
+                unbatched += batch
+                continue
+            starts = entity_offsets(batch, separator)
 
-        return self.process_output(ast.literal_eval(response.text))
+            for inst, text, confidence, indices in self.process_mentions(yodie_output):
+                idx = bisect.bisect_right(starts, indices[0]) - 1
+                if idx >= 0 and indices[1] <= starts[idx] + len(batch[idx]):
+                    ne_links[batch[idx]].append((inst, text, confidence))
+
+        if unbatched:
+            for entity, links in zip(unbatched, self.call_many(unbatched)):
+                ne_links[entity] = links
+
+        return ne_links
 
     # Extract DBPedia entities from yodie output
     def process_output(self, yodie_output):
+        return [(inst, text, confidence) for inst, text, confidence, _ in self.process_mentions(yodie_output)]
+
+    # Same as process_output, but also keeps the character indices of every mention
+    def process_mentions(self, yodie_output):
         ne_links = []
 
         if 'entities' in yodie_output and 'Mention' in yodie_output['entities']:
@@ -33,6 +78,17 @@ class Yodie:
                 indices = mention['indices']
                 confidence = mention['confidence']
                 text = yodie_output['text'][indices[0]:indices[1]]
-                ne_links.append((inst, text, confidence))
+                ne_links.append((inst, text, confidence, indices))
 
         return ne_links
+
+# Start offsets of the parts of a document joined with the separator
+def entity_offsets(parts, separator):
+    starts = []
+    offset = 0
+
+    for part in parts:
+        starts.append(offset)
+        offset += len(part) + len(separator)
+
+    return starts